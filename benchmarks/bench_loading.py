@@ -0,0 +1,47 @@
+"""
+Time of loading the ground truth CSV file with DefaultPlatformParser: column loader vs line by line parsing.
+Usage: python -m benchmarks.bench_loading [--rows=1000000] [--path=bench_loading.csv]
+"""
+import os
+import timeit
+
+import fire
+import numpy as np
+
+from ep.evalplatform.parsers import DefaultPlatformParser
+
+
+def write_ground_truth(path, rows, cells_per_frame=1000, frame_size=2048):
+    random = np.random.RandomState(0)
+    with open(path, "w") as f:
+        f.write("Frame_number,Cell_number,Cell_colour,Position_X,Position_Y,Unique_cell_number\n")
+        for start in range(0, rows, cells_per_frame):
+            frame = start // cells_per_frame + 1
+            for cell in range(1, min(cells_per_frame, rows - start) + 1):
+                f.write("{0},{1},{2},{3:.2f},{4:.2f},{1}\n".format(frame, cell, int(cell % 10 == 0),
+                                                                   random.uniform(0, frame_size),
+                                                                   random.uniform(0, frame_size)))
+
+
+def load_by_lines(path):
+    parser = DefaultPlatformParser()
+    with open(path, "rU") as data_file:
+        return list(parser.iterate(data_file))
+
+
+def run(rows=1000000, path="bench_loading.csv"):
+    if not os.path.exists(path):
+        write_ground_truth(path, rows)
+
+    by_columns = timeit.timeit(lambda: DefaultPlatformParser().load_from_file(path), number=1)
+    print("columns: {0:.2f}s ({1:.2f}us per row)".format(by_columns, by_columns * 1e6 / rows))
+    by_columns_cells = timeit.timeit(lambda: list(DefaultPlatformParser().load_from_file(path)), number=1)
+    print("columns with all cells created: {0:.2f}s ({1:.2f}us per row)".format(by_columns_cells,
+                                                                                by_columns_cells * 1e6 / rows))
+    by_lines = timeit.timeit(lambda: load_by_lines(path), number=1)
+    print("lines: {0:.2f}s ({1:.2f}us per row), speedup {2:.1f}x".format(by_lines, by_lines * 1e6 / rows,
+                                                                         by_lines / by_columns))
+
+
+if __name__ == '__main__':
+    fire.Fire(run)
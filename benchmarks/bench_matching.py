@@ -0,0 +1,58 @@
+"""
+Compare greedy and optimal matching on dense frames.
+Usage: python -m benchmarks.bench_matching [--cells=5000] [--repeats=3]
+"""
+import timeit
+
+import fire
+import numpy as np
+
+from benchmarks.synthetic import random_frame, random_mask_frame
+from ep.evalplatform import plot_comparison
+from ep.evalplatform.matching import edge_components, OverlapTable
+
+
+def measure(ground_truth, results, method, repeats):
+    plot_comparison.matching_method = method
+    matching = plot_comparison.find_correspondence(ground_truth, results)
+    seconds = min(timeit.repeat(lambda: plot_comparison.find_correspondence(ground_truth, results),
+                                number=1, repeat=repeats))
+    return seconds, len(matching)
+
+
+def largest_component(ground_truth, results):
+    """
+    Returns::
+        number of cells in the largest connected component of the graph solved by optimal matching
+    """
+    edges = plot_comparison.similarity_edges(ground_truth, results, OverlapTable.from_cells(ground_truth, results))
+    if not edges:
+        return 0
+    ground_truth_index = dict([(id(c), i) for (i, c) in enumerate(ground_truth)])
+    results_index = dict([(id(c), i) for (i, c) in enumerate(results)])
+    edge_a = np.array([ground_truth_index[id(g)] for (_, (g, _)) in edges])
+    edge_b = np.array([results_index[id(r)] for (_, (_, r)) in edges])
+    edge_component = edge_components(edge_a, edge_b)
+    component_a = np.full(len(ground_truth), -1)
+    component_a[edge_a] = edge_component
+    component_b = np.full(len(results), -1)
+    component_b[edge_b] = edge_component
+    sizes = np.bincount(np.concatenate([component_a[component_a >= 0], component_b[component_b >= 0]]))
+    return int(sizes.max())
+
+
+def run(cells=5000, repeats=3):
+    frames = [("positions", random_frame(cells)), ("masks", random_mask_frame(cells))]
+    for name, (ground_truth, results) in frames:
+        greedy_time, greedy_matched = measure(ground_truth, results, "greedy", repeats)
+        optimal_time, optimal_matched = measure(ground_truth, results, "optimal", repeats)
+        print("{0}: {1} ground truth x {2} results cells, largest component {3} cells".format(
+            name, len(ground_truth), len(results), largest_component(ground_truth, results)))
+        print("    greedy:  {0:.3f}s, matched {1}".format(greedy_time, greedy_matched))
+        print("    optimal: {0:.3f}s, matched {1} ({2:.2f}x greedy time)".format(optimal_time, optimal_matched,
+                                                                                 optimal_time / greedy_time))
+    plot_comparison.matching_method = "greedy"
+
+
+if __name__ == '__main__':
+    fire.Fire(run)
@@ -0,0 +1,67 @@
+"""
+Memory used by the loaded cells: list of (frame, CellOccurence) before (attributes in __dict__) and after
+using __slots__ vs CellTable.
+Usage: python -m benchmarks.bench_memory [--rows=1000000]
+"""
+import tracemalloc
+
+import fire
+import numpy as np
+
+from ep.evalplatform.yeast_datatypes import CellOccurence, CellTable
+
+
+class DictCellOccurence(object):
+    """CellOccurence with the attributes kept in __dict__ as before __slots__ were used."""
+
+    def __init__(self, frame_number, cell_id, unique_id, position, colour=0):
+        self.frame_number = frame_number
+        self.cell_id = cell_id
+        self.unique_id = unique_id
+        self.position = position
+        self.colour = colour
+        self.mask = None
+        self.mask_slice = None
+
+
+def columns(rows, cells_per_frame=1000, frame_size=2048):
+    random = np.random.RandomState(0)
+    frame_number = np.arange(rows) // cells_per_frame + 1
+    cell_id = np.arange(rows) % cells_per_frame + 1
+    return (frame_number, cell_id, cell_id, random.uniform(0, frame_size, rows), random.uniform(0, frame_size, rows),
+            (cell_id % 10 == 0).astype(np.int64))
+
+
+def cells_list(cell_type):
+    def create(frame_number, cell_id, unique_id, position_x, position_y, colour):
+        return [(f, cell_type(f, c, u, (x, y), col)) for (f, c, u, x, y, col) in
+                zip(frame_number.tolist(), cell_id.tolist(), unique_id.tolist(), position_x.tolist(),
+                    position_y.tolist(), colour.tolist())]
+
+    return create
+
+
+def cell_table(*columns):
+    return CellTable(*[np.array(column) for column in columns])
+
+
+def measure(create, data):
+    tracemalloc.start()
+    cells = create(*data)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del cells
+    return size
+
+
+def run(rows=1000000):
+    data = columns(rows)
+    for (name, create) in [("CellOccurence list (__dict__)", cells_list(DictCellOccurence)),
+                           ("CellOccurence list (__slots__)", cells_list(CellOccurence)),
+                           ("CellTable", cell_table)]:
+        size = measure(create, data)
+        print("{0}: {1:.1f}MB ({2:.0f} bytes per cell)".format(name, size / 1e6, size / float(rows)))
+
+
+if __name__ == '__main__':
+    fire.Fire(run)
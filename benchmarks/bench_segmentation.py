@@ -0,0 +1,47 @@
+"""
+Time of calculate_stats_segmentation on growing frames, per cell time should stay flat as it is linear.
+Usage: python -m benchmarks.bench_segmentation [--sizes=[1000,2000,4000,8000]] [--repeats=3]
+"""
+import timeit
+
+import fire
+
+from benchmarks.synthetic import random_frame
+from ep.evalplatform import plot_comparison
+
+
+def border_frame(cells_count, frame_size):
+    """Random frame with some non-obligatory ground truth cells and cells close to the border."""
+    ground_truth, results = random_frame(cells_count, frame_size)
+    for cell in ground_truth[::10]:
+        cell.colour = 1
+    return ground_truth, results
+
+
+def measure(cells_count, repeats, frame_size=2048):
+    ground_truth, results = border_frame(cells_count, frame_size)
+    matching = (plot_comparison.find_correspondence(ground_truth, results), None)
+    image_size = (frame_size, frame_size)
+
+    def evaluate():
+        colours = [c.colour for c in ground_truth + results]
+        stats = plot_comparison.calculate_stats_segmentation(ground_truth, results, image_size, matching)
+        for (cell, colour) in zip(ground_truth + results, colours):
+            cell.colour = colour
+        return stats
+
+    stats = evaluate()
+    seconds = min(timeit.repeat(evaluate, number=1, repeat=repeats))
+    return seconds, stats
+
+
+def run(sizes=(1000, 2000, 4000, 8000), repeats=3):
+    plot_comparison.ignored_frame_size = 20
+    for cells_count in sizes:
+        seconds, (cr, cg, corr, fp, fn) = measure(cells_count, repeats)
+        print("{0} cells: {1:.3f}s ({2:.2f}us per cell), correct {3}, false positives {4}, false negatives {5}".format(
+            cells_count, seconds, seconds * 1e6 / cells_count, len(corr), len(fp), len(fn)))
+
+
+if __name__ == '__main__':
+    fire.Fire(run)
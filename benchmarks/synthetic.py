@@ -0,0 +1,68 @@
+"""Synthetic frames used by the benchmarks."""
+import numpy as np
+from scipy.ndimage import find_objects
+
+from ep.evalplatform.yeast_datatypes import CellOccurence
+
+
+def random_positions(cells_count, frame_size, seed=0):
+    """
+    Ground truth and results positions: results are shifted ground truth with some cells missing and some added.
+    Returns::
+        (ground_truth_positions, results_positions)
+    """
+    random = np.random.RandomState(seed)
+    ground_truth = random.uniform(0, frame_size, (cells_count, 2))
+    found = ground_truth[random.uniform(size=cells_count) > 0.05]
+    results = np.concatenate([found + random.normal(0, 3, found.shape),
+                              random.uniform(0, frame_size, (cells_count // 20, 2))])
+    return ground_truth, results[random.permutation(len(results))]
+
+
+def random_frame(cells_count, frame_size=2048, seed=0):
+    """
+    Returns::
+        ([Cell], [Cell]) - ground truth and results cells of one frame
+    """
+    ground_truth, results = random_positions(cells_count, frame_size, seed)
+    return ([CellOccurence(1, i, -1, tuple(p)) for i, p in enumerate(ground_truth, 1)],
+            [CellOccurence(1, i, -1, tuple(p)) for i, p in enumerate(results, 1)])
+
+
+def paint_label_image(positions, frame_size, radius):
+    labels = np.zeros((frame_size, frame_size), dtype=np.int32)
+    for label, (x, y) in enumerate(positions.astype(int), 1):
+        labels[max(0, y - radius): y + radius + 1, max(0, x - radius): x + radius + 1] = label
+    return labels
+
+
+def random_label_frame(cells_count, frame_size=2048, radius=8, seed=0):
+    """
+    Returns::
+        (ground_truth_labels, results_labels) - label images of one frame
+    """
+    ground_truth, results = random_positions(cells_count, frame_size, seed)
+    return paint_label_image(ground_truth, frame_size, radius), paint_label_image(results, frame_size, radius)
+
+
+def cells_from_labels(labels):
+    """Create cells with contours from label image (only within object slices to keep it fast)."""
+    cells = []
+    for label, label_slice in enumerate(find_objects(labels), 1):
+        if label_slice is not None:
+            mask = labels[label_slice] == label
+            ys, xs = np.nonzero(mask)
+            cell = CellOccurence(1, label, -1, (xs.mean() + label_slice[1].start, ys.mean() + label_slice[0].start))
+            cell.mask = mask
+            cell.mask_slice = label_slice
+            cells.append(cell)
+    return cells
+
+
+def random_mask_frame(cells_count, frame_size=2048, radius=8, seed=0):
+    """
+    Returns::
+        ([Cell], [Cell]) - ground truth and results cells with contours of one frame
+    """
+    ground_truth, results = random_label_frame(cells_count, frame_size, radius, seed)
+    return cells_from_labels(ground_truth), cells_from_labels(results)
@@ -0,0 +1,178 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+
+import numpy as np
+
+from ep.evalplatform.utils import debug_center, get_memory_input, parse_file_order, split_archive_path
+from ep.evalplatform.yeast_datatypes import CellTable, PackedMask
+
+# changed whenever the format of the stored tables changes so that the old entries are not used
+CACHE_VERSION = 2
+CACHE_SUFFIX = ".cells.npz"
+
+
+def save_table(path, table):
+    """
+    Save CellTable (with the masks) to npz file. Packed masks are concatenated into one flat array.
+    """
+    rows = table.row_indices()
+    frame_number = table.frame_number[rows]
+    columns = {"cell_id": table.cell_id[rows], "unique_id": table.unique_id[rows],
+               "position_x": table.position_x[rows], "position_y": table.position_y[rows],
+               "colour": table.colour[rows]}
+    if frame_number.dtype == object:
+        # frames named with strings, numbers are restored by parse_file_order
+        columns["frame_name"] = np.array([str(f) for f in frame_number], dtype=np.str_)
+    else:
+        columns["frame_number"] = frame_number
+
+    if table.mask is not None:
+        mask_slices = [table.mask_slice[r] for r in rows]
+        # masks are stored packed (8 pixels in a byte), see PackedMask
+        masks = [PackedMask.pack(m, s) if m is not None and not isinstance(m, PackedMask) else m
+                 for (m, s) in zip([table.mask[r] for r in rows], mask_slices)]
+        has_mask = np.array([m is not None for m in masks], dtype=bool)
+        columns["mask_bounds"] = np.array([(s[0].start, s[0].stop, s[1].start, s[1].stop) if m is not None
+                                           else (0, 0, 0, 0) for (m, s) in zip(masks, mask_slices)],
+                                          dtype=np.int64).reshape(-1, 4)
+        columns["mask_shape"] = np.array([m.shape if m is not None else (0, 0) for m in masks],
+                                         dtype=np.int64).reshape(-1, 2)
+        columns["mask_bits"] = np.concatenate([m.bits.ravel() for m in masks if m is not None] +
+                                              [np.zeros(0, dtype=np.uint8)])
+        columns["has_mask"] = has_mask
+    np.savez(path, **columns)
+
+
+def load_table(path):
+    """
+    Returns::
+        CellTable saved with save_table
+    """
+    with np.load(path, allow_pickle=False) as data:
+        if "frame_name" in data:
+            frame_number = np.empty(len(data["frame_name"]), dtype=object)
+            for (i, frame) in enumerate(data["frame_name"].tolist()):
+                frame_number[i] = parse_file_order(frame)
+        else:
+            frame_number = data["frame_number"]
+
+        mask = mask_slice = None
+        if "mask_bits" in data:
+            (mask_bits, mask_shape, mask_bounds) = (data["mask_bits"], data["mask_shape"], data["mask_bounds"])
+            mask = np.empty(len(mask_shape), dtype=object)
+            mask_slice = np.empty(len(mask_shape), dtype=object)
+            # packed rows start from the column which is a multiple of 8
+            row_bytes = (mask_bounds[:, 2] % 8 + mask_shape[:, 1] + 7) // 8
+            offsets = np.concatenate([[0], np.cumsum(mask_shape[:, 0] * row_bytes)])
+            for (i, has_mask) in enumerate(data["has_mask"].tolist()):
+                if has_mask:
+                    (height, width) = mask_shape[i].tolist()
+                    (y0, y1, x0, x1) = mask_bounds[i].tolist()
+                    bits = mask_bits[offsets[i]:offsets[i + 1]].reshape(height, int(row_bytes[i]))
+                    mask[i] = PackedMask(bits, y0, x0, width)
+                    mask_slice[i] = (slice(y0, y1), slice(x0, x1))
+
+        return CellTable(frame_number, data["cell_id"], data["unique_id"], data["position_x"], data["position_y"],
+                         data["colour"], mask, mask_slice)
+
+
+def file_digest(path, block_size=1 << 20):
+    text = get_memory_input(path)
+    if text is not None:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    (archive_path, member) = split_archive_path(path)
+    if member is not None:
+        # checksum and size of the files in archive are stored in the archive so they are not decompressed
+        with zipfile.ZipFile(archive_path) as archive:
+            info = archive.getinfo(member)
+        return "{0:08x}-{1}".format(info.CRC, info.file_size)
+
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class InputCache(object):
+    """On-disk cache of the parsed input files.
+
+    Entries are keyed by the parser (symbol and configuration) and by the path and content hash of every file
+    the data is read from (modification time is not used as the merged inputs are recreated every run).
+    The least recently used entries are removed when the total size of the cache exceeds max_size bytes.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, path, parser):
+        files = [(os.path.abspath(f), file_digest(f)) for f in parser.input_files(path)]
+        description = repr((CACHE_VERSION, parser.symbol, parser.__class__.__name__, parser.configuration(), files))
+        return hashlib.sha1(description.encode("utf-8")).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def load(self, path, parser):
+        """
+        Read cells from the cache or parse them (and store in the cache) if they are not there yet.
+        Returns::
+            CellTable
+        """
+        entry_path = self.entry_path(self.key(path, parser))
+        if os.path.isfile(entry_path):
+            try:
+                table = load_table(entry_path)
+                os.utime(entry_path, None)  # modification time is used to find the least recently used entries
+                debug_center.show_in_console(None, "Tech", "".join(["Loaded ", path, " from cache ", entry_path]))
+                return table
+            except Exception as e:
+                debug_center.show_in_console(None, "Warning", "".join(["Cache entry ", entry_path,
+                                                                       " could not be read: ", str(e)]))
+
+        cells = parser.load_from_file(path)
+        table = cells if isinstance(cells, CellTable) else CellTable.from_cells([cell for (_, cell) in cells])
+        self.store(entry_path, table)
+        return table
+
+    def store(self, entry_path, table):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        # written to temporary file first so that other runs never read incomplete entries
+        (handle, temporary_path) = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        stored = False
+        try:
+            with os.fdopen(handle, "wb") as temporary_file:
+                save_table(temporary_file, table)
+            try:
+                os.rename(temporary_path, entry_path)
+                stored = True
+            except OSError:
+                pass  # entry was stored by another run in the meantime
+        finally:
+            # incomplete entries are never left in the cache (e.g. when the table could not be saved)
+            if not stored:
+                os.remove(temporary_path)
+        self.evict()
+
+    def entries(self):
+        """
+        Returns::
+            [(modification time, size, path)] of the cache entries from the least recently used
+        """
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory)
+                 if name.endswith(CACHE_SUFFIX)]
+        return sorted([(os.path.getmtime(p), os.path.getsize(p), p) for p in paths])
+
+    def evict(self):
+        entries = self.entries()
+        total_size = sum([size for (_, size, _) in entries])
+        for (_, size, path) in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(path)
+            total_size -= size
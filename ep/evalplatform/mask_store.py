@@ -0,0 +1,83 @@
+import atexit
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+
+from ep.evalplatform.yeast_datatypes import PackedMask
+
+
+class FrameMasks(object):
+    """Label image of one frame kept in npy file, the masks of its cells (labelled with cell_id) are cut out of
+    the memory-mapped file when they are needed."""
+
+    def __init__(self, path):
+        self.path = path
+        self.labels = None
+
+    def label_image(self):
+        """
+        Returns::
+            memory-mapped label image of the frame
+        """
+        if self.labels is None:
+            self.labels = np.load(self.path, mmap_mode="r")
+        return self.labels
+
+    def cell_mask(self, cell):
+        return PackedMask.pack(self.label_image()[cell.mask_slice] == cell.cell_id, cell.mask_slice)
+
+    def release(self):
+        self.labels = None
+
+    def __getstate__(self):
+        # copied (e.g. to the worker processes) without the mapping, the file is mapped again if needed
+        return {"path": self.path, "labels": None}
+
+
+class MaskStore(object):
+    """Temporary directory with the label images of the parsed frames (see FrameMasks) which is removed at exit.
+
+    The directory is created in root (or in the system temporary directory) when the first frame is stored.
+    """
+
+    def __init__(self, root=None):
+        self.root = root
+        self.directory = None
+        self.counter = itertools.count()
+        self.lock = threading.Lock()  # images can be parsed in many threads
+
+    def store(self, label_image):
+        """
+        Returns::
+            FrameMasks of the saved label image
+        """
+        with self.lock:
+            if self.directory is None:
+                if self.root and not os.path.isdir(self.root):
+                    os.makedirs(self.root)
+                self.directory = tempfile.mkdtemp(prefix="masks", dir=self.root or None)
+                atexit.register(self.clear)
+            path = os.path.join(self.directory, "{0}.npy".format(next(self.counter)))
+        np.save(path, label_image)
+        return FrameMasks(path)
+
+    def clear(self):
+        if self.directory is not None:
+            shutil.rmtree(self.directory, ignore_errors=True)
+            self.directory = None
+
+
+def release_masks(cells):
+    """
+    Drop the masks of the cells which can be read again from their mask_source (e.g. after their frame is evaluated).
+    """
+    sources = set()
+    for cell in cells:
+        if cell.release_mask():
+            sources.add(cell.mask_source)
+    for source in sources:
+        source.release()
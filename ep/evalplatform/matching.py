@@ -0,0 +1,343 @@
+from collections import defaultdict
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix, csr_matrix
+from scipy.sparse.csgraph import connected_components
+from scipy.spatial import cKDTree
+
+from ep.evalplatform.yeast_datatypes import unpack_mask
+
+try:
+    from scipy.sparse.csgraph import min_weight_full_bipartite_matching
+except ImportError:  # scipy < 1.6
+    min_weight_full_bipartite_matching = None
+
+
+def slice_bounds(cells):
+    """
+    Returns::
+        array of (y_start, y_stop, x_start, x_stop) rows, one for every cell mask_slice
+    """
+    bounds = [(c.mask_slice[0].start, c.mask_slice[0].stop, c.mask_slice[1].start, c.mask_slice[1].stop)
+              for c in cells]
+    return np.array(bounds, dtype=np.int64).reshape(-1, 4)
+
+
+def close_positions(points_a, points_b, cutoff):
+    """
+    Find all pairs of points which are not further than cutoff from each other using KD-trees.
+    Points with undefined (nan) coordinates are never close to anything.
+    Args::
+        points_a, points_b - arrays of (x, y) rows
+    Returns::
+        [(index_a, index_b)]
+    """
+    finite_a = np.nonzero(np.isfinite(points_a).all(axis=1))[0]
+    finite_b = np.nonzero(np.isfinite(points_b).all(axis=1))[0]
+    if len(finite_a) == 0 or len(finite_b) == 0:
+        return []
+    tree_b = cKDTree(points_b[finite_b])
+    neighbours = cKDTree(points_a[finite_a]).query_ball_tree(tree_b, cutoff)
+    return [(finite_a[a], finite_b[b]) for a, close_b in enumerate(neighbours) for b in close_b]
+
+
+def overlapping_bounds(bounds_a, bounds_b):
+    """
+    Find all pairs of bounding boxes which overlap (or touch, same as in slices_intersection) using uniform grid.
+    Args::
+        bounds_a, bounds_b - arrays of (y_start, y_stop, x_start, x_stop) rows
+    Returns::
+        [(index_a, index_b)]
+    """
+    if len(bounds_a) == 0 or len(bounds_b) == 0:
+        return []
+
+    # grid cells of the typical object size so that every box is registered in just a few of them
+    extents = np.concatenate([bounds_a[:, 1] - bounds_a[:, 0], bounds_a[:, 3] - bounds_a[:, 2],
+                              bounds_b[:, 1] - bounds_b[:, 0], bounds_b[:, 3] - bounds_b[:, 2]])
+    grid_size = max(1, int(np.median(extents)))
+
+    def grid_cells(bounds):
+        (y0, y1, x0, x1) = bounds // grid_size
+        return [(gy, gx) for gy in range(y0, y1 + 1) for gx in range(x0, x1 + 1)]
+
+    grid = defaultdict(list)
+    for b, bounds in enumerate(bounds_b):
+        for grid_cell in grid_cells(bounds):
+            grid[grid_cell].append(b)
+
+    pairs = []
+    for a, (y0, y1, x0, x1) in enumerate(bounds_a):
+        checked = set()
+        for grid_cell in grid_cells(bounds_a[a]):
+            for b in grid.get(grid_cell, []):
+                if b not in checked:
+                    checked.add(b)
+                    (by0, by1, bx0, bx1) = bounds_b[b]
+                    if not (y0 > by1 or x0 > bx1 or by0 > y1 or bx0 > x1):
+                        pairs.append((a, b))
+    return pairs
+
+
+def candidate_pairs(ground_truth, results, position_cutoff):
+    """
+    Find pairs of cells which may be similar so that the rest of the cross product does not have to be checked.
+    Cells with contours can be similar only if their masks overlap, otherwise they have to be close enough.
+    Input: [Cell] x2
+    Returns::
+        [(ground_truth_index, results_index)] sorted as in cross product of the inputs
+    """
+    gt_masked = [i for i, c in enumerate(ground_truth) if c.has_contour_data()]
+    gt_plain = [i for i, c in enumerate(ground_truth) if not c.has_contour_data()]
+    res_masked = [i for i, c in enumerate(results) if c.has_contour_data()]
+    res_plain = [i for i, c in enumerate(results) if not c.has_contour_data()]
+
+    def positions(cells, indices):
+        return np.array([cells[i].position for i in indices], dtype=float).reshape(-1, 2)
+
+    def close_cells(gt_indices, res_indices):
+        pairs = close_positions(positions(ground_truth, gt_indices), positions(results, res_indices),
+                                position_cutoff)
+        return [(gt_indices[a], res_indices[b]) for (a, b) in pairs]
+
+    pairs = [(gt_masked[a], res_masked[b]) for (a, b) in
+             overlapping_bounds(slice_bounds([ground_truth[i] for i in gt_masked]),
+                                slice_bounds([results[i] for i in res_masked]))]
+    pairs += close_cells(list(range(len(ground_truth))), res_plain)
+    pairs += close_cells(gt_plain, res_masked)
+    return sorted(pairs)
+
+
+class OverlapTable(object):
+    """Sparse ground truth x results overlap matrix of two label images.
+
+    It is calculated in one pass over the pixels of both images and the areas of all the objects are derived from it.
+
+    Attributes:
+        overlaps - {(ground_truth_label, results_label): number of common pixels} for the overlapping objects only
+        pair_ground_truth, pair_results, pair_counts - the same as overlaps in arrays sorted by the labels
+        ground_truth_areas, results_areas - arrays with the area of every label (for background label only the
+            pixels labelled in the other image are counted)
+    """
+
+    def __init__(self, ground_truth_labels, results_labels):
+        ground_truth_labels = np.asarray(ground_truth_labels).ravel()
+        results_labels = np.asarray(results_labels).ravel()
+        labelled = np.nonzero(ground_truth_labels | results_labels)[0]
+        ground_truth_labels = ground_truth_labels[labelled].astype(np.int64)
+        results_labels = results_labels[labelled].astype(np.int64)
+
+        ground_truth_count = ground_truth_labels.max() + 1 if len(labelled) else 1
+        results_count = results_labels.max() + 1 if len(labelled) else 1
+        pair_ids = ground_truth_labels * results_count + results_labels
+        if ground_truth_count * results_count <= max(len(pair_ids), 1024):
+            counts = np.bincount(pair_ids, minlength=ground_truth_count * results_count)
+            pair_ids = np.nonzero(counts)[0]
+            counts = counts[pair_ids]
+        else:
+            # contingency table is too large to be dense
+            pair_ids, counts = np.unique(pair_ids, return_counts=True)
+
+        pair_ground_truth, pair_results = pair_ids // results_count, pair_ids % results_count
+        self.ground_truth_areas = np.bincount(pair_ground_truth, weights=counts,
+                                              minlength=ground_truth_count).astype(np.int64)
+        self.results_areas = np.bincount(pair_results, weights=counts, minlength=results_count).astype(np.int64)
+
+        both = (pair_ground_truth != 0) & (pair_results != 0)
+        (self.pair_ground_truth, self.pair_results, self.pair_counts) = (pair_ground_truth[both],
+                                                                         pair_results[both], counts[both])
+        self.overlaps = dict(zip(zip(self.pair_ground_truth.tolist(), self.pair_results.tolist()),
+                                 self.pair_counts.tolist()))
+
+    def pairs(self):
+        """Return sorted list of (ground_truth_label, results_label) of all overlapping objects."""
+        return sorted(self.overlaps.keys())
+
+    def overlap(self, ground_truth_label, results_label):
+        return self.overlaps.get((ground_truth_label, results_label), 0)
+
+    def iou(self, ground_truth_label, results_label):
+        intersect = float(self.overlap(ground_truth_label, results_label))
+        return intersect / (int(self.ground_truth_areas[ground_truth_label]) +
+                            int(self.results_areas[results_label]) - intersect)
+
+    def pair_ious(self):
+        """
+        Returns::
+            array of iou of every overlapping pair (pair_ground_truth, pair_results)
+        """
+        intersect = self.pair_counts.astype(np.float64)
+        return intersect / (self.ground_truth_areas[self.pair_ground_truth] +
+                            self.results_areas[self.pair_results] - intersect)
+
+    def index_iou(self, ground_truth_index, results_index):
+        """Return iou of the cells (given by their indices in the lists) used to create the table (see from_cells)."""
+        return self.iou(ground_truth_index + 1, results_index + 1)
+
+    @staticmethod
+    def source_labels(cells):
+        """
+        Relabel the label image which all the cells were parsed from (their common mask_source) so that i-th cell is
+        labelled with i + 1.
+        Returns::
+            label image or None if the cells do not come from one label image
+        """
+        sources = set([id(c.mask_source) for c in cells])
+        if len(sources) != 1 or cells[0].mask_source is None or not hasattr(cells[0].mask_source, "label_image"):
+            return None
+        cell_ids = np.array([c.cell_id for c in cells])
+        if cell_ids.dtype.kind not in "iu" or cell_ids.min() < 1 or len(np.unique(cell_ids)) != len(cell_ids):
+            return None
+
+        source = cells[0].mask_source.label_image()
+        lookup = np.zeros(max(int(source.max()), int(cell_ids.max())) + 1, dtype=np.int32)
+        lookup[cell_ids] = np.arange(1, len(cells) + 1)
+        return lookup[source]
+
+    @staticmethod
+    def paint_labels(cells, shape):
+        """
+        Recreate label image from the cell masks where i-th cell is labelled with i + 1.
+        Returns::
+            label image or None if any of the masks overlap
+        """
+        labels = np.zeros(shape, dtype=np.int32)
+        for label, cell in enumerate(cells, 1):
+            region = labels[cell.mask_slice]
+            mask = unpack_mask(cell.stored_mask())
+            if region[mask].any():
+                return None
+            region[mask] = label
+        return labels
+
+    @staticmethod
+    def frame_labels(cells):
+        """
+        Label image of the cells: taken from the label image they were parsed from or painted from their masks.
+        Returns::
+            label image or None if any of the masks overlap
+        """
+        labels = OverlapTable.source_labels(cells) if cells else None
+        if labels is None:
+            bounds = slice_bounds(cells)
+            labels = OverlapTable.paint_labels(cells, (int(bounds[:, 1].max(initial=0)),
+                                                       int(bounds[:, 3].max(initial=0))))
+        return labels
+
+    @staticmethod
+    def from_cells(ground_truth, results):
+        """
+        Create table for the cells from one frame.
+        Labels in the table correspond to the order of the cells: i-th cell has label i + 1.
+        Returns::
+            OverlapTable or None if not every cell has contour or masks in one of the sets overlap
+        """
+        if not all([c.has_contour_data() for c in ground_truth]) or not all(
+                [c.has_contour_data() for c in results]):
+            return None
+
+        ground_truth_labels = OverlapTable.frame_labels(ground_truth)
+        results_labels = OverlapTable.frame_labels(results)
+        if ground_truth_labels is None or results_labels is None:
+            return None
+        return OverlapTable(*common_shape_labels(ground_truth_labels, results_labels))
+
+
+def common_shape_labels(ground_truth_labels, results_labels):
+    """Pad both label images with background to the same shape."""
+    shape = tuple(np.maximum(ground_truth_labels.shape, results_labels.shape))
+    padded = []
+    for labels in (ground_truth_labels, results_labels):
+        if labels.shape != shape:
+            labels_padded = np.zeros(shape, dtype=labels.dtype)
+            labels_padded[tuple(slice(0, size) for size in labels.shape)] = labels
+            labels = labels_padded
+        padded.append(labels)
+    return padded
+
+
+def edge_components(edge_a, edge_b):
+    """
+    Split bipartite graph into connected components.
+    Args::
+        edge_a, edge_b - arrays with the node indices (on a and b side) of every edge
+    Returns::
+        array with the component of every edge
+    """
+    nodes_a = edge_a.max() + 1
+    # nodes of b side are placed after the nodes of a side
+    graph = coo_matrix((np.ones(len(edge_a)), (edge_a, edge_b + nodes_a)), shape=(nodes_a + edge_b.max() + 1,) * 2)
+    _, node_component = connected_components(graph, directed=False)
+    return node_component[edge_a]
+
+
+def assign_component(edge_a, edge_b, weights):
+    """
+    Maximum weight matching of the (connected) bipartite graph.
+    Returns::
+        indices of the matched edges
+    """
+    rows, row_edge = np.unique(edge_a, return_inverse=True)
+    columns, column_edge = np.unique(edge_b, return_inverse=True)
+    (row_count, column_count) = (len(rows), len(columns))
+    if min_weight_full_bipartite_matching is None:
+        component_weights = np.zeros((row_count, column_count))
+        component_weights[row_edge, column_edge] = weights
+        assigned_rows, assigned_columns = linear_sum_assignment(-component_weights)
+    else:
+        # the graph stays sparse: every row gets its own dummy column so that all the rows can always be matched,
+        # costs are positive and matching with the dummy costs as much as the real edge of zero weight
+        base = weights.max() + 1
+        dummies = np.arange(row_count)
+        costs = csr_matrix((np.concatenate([base - weights, np.full(row_count, base)]),
+                            (np.concatenate([row_edge, dummies]),
+                             np.concatenate([column_edge, column_count + dummies]))),
+                           shape=(row_count, column_count + row_count))
+        assigned_rows, assigned_columns = min_weight_full_bipartite_matching(costs)
+        real = assigned_columns < column_count
+        (assigned_rows, assigned_columns) = (assigned_rows[real], assigned_columns[real])
+
+    # find the edges of the assigned (row, column) pairs, zero weight pairs of the dense problem are not edges
+    edge_keys = row_edge * column_count + column_edge
+    order = np.argsort(edge_keys)
+    assigned_keys = assigned_rows * column_count + assigned_columns
+    positions = np.minimum(np.searchsorted(edge_keys[order], assigned_keys), len(order) - 1)
+    found = edge_keys[order][positions] == assigned_keys
+    return order[positions[found]]
+
+
+def optimal_matching(edges):
+    """
+    Maximum weight bipartite matching of the sparse graph given by edges.
+    Graph is split into connected components which are solved independently, each of them as sparse assignment
+    problem (dense one for scipy older than 1.6).
+    Args::
+        edges - [(weight, (a, b))] where weight has to be positive
+    Returns::
+        [(a, b)] sorted by descending weight
+    """
+    nodes_a, nodes_b = {}, {}
+    for (_, (a, b)) in edges:
+        nodes_a.setdefault(a, len(nodes_a))
+        nodes_b.setdefault(b, len(nodes_b))
+    if not edges:
+        return []
+
+    edge_a = np.array([nodes_a[a] for (_, (a, _)) in edges])
+    edge_b = np.array([nodes_b[b] for (_, (_, b)) in edges])
+    weights = np.array([w for (w, _) in edges], dtype=float)
+    edge_component = edge_components(edge_a, edge_b)
+
+    chosen = []
+    order = np.argsort(edge_component, kind="mergesort")
+    component_starts = np.nonzero(np.diff(edge_component[order]))[0] + 1
+    for component_edges in np.split(order, component_starts):
+        if len(component_edges) == 1:
+            chosen.append(component_edges[0])
+            continue
+        assigned = assign_component(edge_a[component_edges], edge_b[component_edges], weights[component_edges])
+        chosen.extend(component_edges[assigned])
+
+    chosen = sorted(chosen, key=lambda e: -weights[e])
+    return [edges[e][1] for e in chosen]
@@ -1,11 +1,14 @@
 import csv
 import itertools
 
+import numpy as np
+
 try:
     from StringIO import StringIO
 except ImportError:
     from io import StringIO
 
+from ep.evalplatform.utils import open_input, parse_file_order
 from ep.evalplatform.yeast_datatypes import *
 
 
@@ -61,14 +64,34 @@ class CSVCellParser:
             data_split = list(csv.reader([line]))[0]
         return [col.replace(",", ".").strip() for col in data_split]
 
+    def configuration(self):
+        """
+        Returns::
+            description of the parser settings which affect the parsed data
+        """
+        return repr(sorted(self.__class__.map_name.items()))
+
+    def input_files(self, path):
+        """
+        Returns::
+            [path] of all the files read when loading the given path
+        """
+        return [path]
+
     def load_from_file(self, path):
-        with open(path, "rU") as data_file:
+        with open_input(path) as data_file:
             lines = data_file.readlines()
             cells = self.parse(lines)
         return cells
 
+    def iterate_from_file(self, path):
+        """Lazy version of load_from_file which reads the file line by line."""
+        with open_input(path) as data_file:
+            for frame_cell in self.iterate(data_file):
+                yield frame_cell
+
     def set_line(self, line):
-        self.columns = self.csv_split(line)
+        self.columns = self.split_used_line(line, max(self.map_name.values()) + 1)
 
     def get_column(self, value_name):
         return self.columns[self.map_name[value_name]]
@@ -81,13 +104,111 @@ class CSVCellParser:
         if self.is_csv_header(lines[0]):
             self.configure(lines[0])
             lines = lines[1:]
-        return [self.parse_line(line) for line in lines]
+        # columns are filled row by row without creating the cells
+        columns = ([], [], [], [], [], [])
+        for line in lines:
+            for (column, value) in zip(columns, self.parse_row(line)):
+                column.append(value)
+        (frame_number, cell_id, unique_id, position_x, position_y, colour) = columns
+        return CellTable(CellTable.frame_column([parse_file_order(f) for f in frame_number]), cell_id, unique_id,
+                         position_x, position_y, colour)
+
+    def used_columns(self):
+        """
+        Returns::
+            sorted indices of the columns read by the parser
+        """
+        return sorted(set(self.map_name.values()))
 
-    def parse_line(self, line):
+    def split_line(self, line, columns_count, dialect=None):
+        """
+        Split the line into the columns without normalizing them (as csv_split does).
+        Only the first columns_count columns are separated, the rest of the line is left in the last element.
+        Returns::
+            [string]
+        """
+        dialect = dialect or self.csv_dialect or csv.excel
+        if dialect.quotechar not in line:
+            return line.rstrip("\r\n").split(dialect.delimiter, columns_count)
+        return list(csv.reader([line], dialect))[0]
+
+    def split_used_line(self, line, columns_count, dialect=None):
+        """
+        Split the line and normalize (as csv_split does) only its first columns_count columns.
+        Returns::
+            [string] with values of the first columns_count columns
+        """
+        return [col.replace(",", ".").strip() for col in self.split_line(line, columns_count, dialect)[:columns_count]]
+
+    def split_columns(self, lines, columns, dialect=None):
+        """
+        Split all the lines into columns the same way as csv_split but only the given columns are extracted
+        and normalized. If there are no quotes and every line has the same number of columns the whole text is
+        split at once which is much faster than csv reader. If there are many more columns than used (e.g.
+        CellProfiler measurements) only the beginning of every line up to the last used column is split.
+        The surrounding whitespaces are ignored by the numbers conversion.
+        Args::
+            columns - sorted indices of the columns to extract
+        Returns::
+            {column index: [string]}
+        """
+        dialect = dialect or self.csv_dialect or csv.excel
+        delimiter = dialect.delimiter
+        columns_count = columns[-1] + 1
+        delimiters_counts = set(line.count(delimiter) for line in lines)
+        if len(delimiters_counts) == 1 and not any(dialect.quotechar in line for line in lines):
+            line_columns_count = delimiters_counts.pop() + 1
+            if line_columns_count > 2 * columns_count:
+                # only the beginning of the lines with the used columns is kept
+                lines = [delimiter.join(line.split(delimiter, columns_count)[:columns_count]) for line in lines]
+                line_columns_count = columns_count
+            values = delimiter.join(lines).replace("\n", "").split(delimiter)
+            split = dict((i, values[i::line_columns_count]) for i in columns if i < line_columns_count)
+            if delimiter != ",":
+                split = dict((i, [value.replace(",", ".") for value in column]) for (i, column) in split.items())
+            return split
+
+        rows = [row[:columns_count] for row in csv.reader(lines, dialect)]
+        return dict((i, [row[i].replace(",", ".") for row in rows]) for i in columns)
+
+    def data_lines(self, lines):
+        """
+        Configure parser using the header line (if there is one).
+        Returns::
+            iterator over the lines with data
+        """
+        self.csv_dialect = None
+        lines = iter(lines)
+        first_line = next(lines, None)
+        if first_line is None:
+            return lines
+        if self.is_csv_header(first_line):
+            self.configure(first_line)
+            return lines
+        return itertools.chain([first_line], lines)
+
+    def iterate(self, lines):
+        """
+        Lazy version of parse.
+        Returns::
+            generator of (frame_nr, Cell)
+        """
+        for line in self.data_lines(lines):
+            yield self.parse_line(line)
+
+    def parse_row(self, line):
+        """
+        Returns::
+            (frame_nr, cell_nr, unique_id, position_x, position_y, colour) of the cell in the line
+        """
         self.set_line(line)
-        cell = CellOccurence(self.get_column("frame_nr"), int(self.get_column("cell_nr")), self.unique_id(line),
-                             (float(self.get_column("position_x")), float(self.get_column("position_y"))))
-        cell.colour = self.cell_colour(line)
+        return (self.get_column("frame_nr"), int(self.get_column("cell_nr")), self.unique_id(line),
+                float(self.get_column("position_x")), float(self.get_column("position_y")), self.cell_colour(line))
+
+    def parse_line(self, line):
+        (frame_nr, cell_nr, unique_id, position_x, position_y, colour) = self.parse_row(line)
+        cell = CellOccurence(frame_nr, cell_nr, unique_id, (position_x, position_y))
+        cell.colour = colour
         return cell.frame_number, cell
 
     def configure(self, headers):
@@ -159,12 +280,12 @@ class CellSerpentParser(CSVCellParser):
 
     def get_column(self, value_name):
         if value_name == "frame_nr":
-            tekst = self.columns[self.map_name[value_name]]
+            tekst = CSVCellParser.get_column(self, value_name)
             if not tekst in self.filenames:
                 self.filenames[tekst] = len(self.filenames) + 1
             return self.filenames[tekst]
         else:
-            return self.columns[self.map_name[value_name]]
+            return CSVCellParser.get_column(self, value_name)
 
 
 class DefaultPlatformParser(CSVCellParser):
@@ -226,11 +347,30 @@ class DefaultPlatformParser(CSVCellParser):
         """
         [(frame_nr, cell_id, position_x, position_y)]
         """
+        return self.parse_columns(lines)
+
+    def parse_columns(self, lines):
+        """
+        Parse all the lines at once into typed columns (the same values as parse_line).
+        Returns::
+            CellTable
+        """
         self.csv_dialect = None
         if self.is_csv_header(lines[0]):
             self.configure(lines[0])
             lines = lines[1:]
-        return [self.parse_line(line) for line in lines]
+        rows_count = len(lines)
+        columns = self.split_columns(lines, self.used_columns())
+
+        def column(name, dtype, default=None):
+            if name not in self.map_name:
+                return np.full(rows_count, default, dtype=dtype)
+            return np.array(columns[self.map_name[name]], dtype=dtype)
+
+        return CellTable(column("frame_nr", np.int64), column("cell_nr", np.int64),
+                         column("unique_id", np.float64, -1).astype(np.int64),
+                         column("position_x", np.float64), column("position_y", np.float64),
+                         column("cell_colour", np.float64, 0).astype(np.int64))
 
     def parse_line(self, line):
         self.set_line(line)
@@ -274,22 +414,87 @@ class DefaultPlatformParser(CSVCellParser):
 
 ### ======= Tracking link HIERARCHY ======= ###
 
+class TrackingLinker(object):
+    """Calculates unique_id of the cells from the links to the cells of the previous frame.
+
+    Frames are linked one after another and only the cells of the previous frame are kept.
+    """
+
+    def __init__(self):
+        self.count = 1
+        self.splits = 0
+        # cell_nr (sorted) and unique_id of the cells in the previous frame
+        self.last_cells = np.zeros(0, dtype=np.int64)
+        self.last_ids = np.zeros(0, dtype=np.int64)
+
+    def link(self, frame, cell_nr, last_frame_nr):
+        """
+        Args::
+            frame - number of the frame
+            cell_nr - array of cell numbers in the frame
+            last_frame_nr - array of cell numbers in the previous frame (0 for the new cells)
+        Returns::
+            array of unique_id (0 for the cells which are not found in the previous frame)
+        """
+        new = last_frame_nr == 0
+        if len(self.last_cells) > 0:
+            index = np.minimum(np.searchsorted(self.last_cells, last_frame_nr), len(self.last_cells) - 1)
+            linked = ~new & (self.last_cells[index] == last_frame_nr)
+        else:
+            index = np.zeros(len(cell_nr), dtype=np.int64)
+            linked = np.zeros(len(cell_nr), dtype=bool)
+
+        unique_id = np.zeros(len(cell_nr), dtype=np.int64)
+        unique_id[linked] = self.last_ids[index[linked]]
+        # only the first cell linked to a cell keeps its unique_id, the next ones are splits
+        (_, first_linked) = np.unique(unique_id[linked], return_index=True)
+        split = linked.copy()
+        split[np.flatnonzero(linked)[first_linked]] = False
+        created = new | split
+        unique_id[created] = self.count + np.arange(np.count_nonzero(created))
+        self.count += int(np.count_nonzero(created))
+        self.splits += int(np.count_nonzero(split))
+
+        for lastid in last_frame_nr[~new & ~linked].tolist():
+            print("".join(["CELL NOT IN THE PREVIOUS FRAME??"]))
+            print("{} {} {}".format(frame, lastid, dict(zip(self.last_cells.tolist(), self.last_ids.tolist()))))
+
+        # the last of the cells with the same cell_nr is used
+        found = new | linked
+        order = np.argsort(cell_nr[found], kind="stable")
+        (cells, ids) = (cell_nr[found][order], unique_id[found][order])
+        last = np.ones(len(cells), dtype=bool)
+        last[:-1] = cells[1:] != cells[:-1]
+        (self.last_cells, self.last_ids) = (cells[last], ids[last])
+        return unique_id
+
+    def print_summary(self):
+        if self.splits > 0:
+            print("Number of splits (unhandled yet): {}".format(self.splits))
+
+
 class TrackingLinkParser(CSVCellParser):
     """Base class for parsers of segmentation and tracking data without unique_id.
-    Uses CSVCellParser by providing it with previously preprocessed data (with calculated unique_id).
+    The unique_id is calculated from the links between the frames and used also as cell_nr of the parsed cells.
     
-    Original mapping is used for preprocessing and must include "frame_nr","cell_nr","position_x","position_y","last_frame_nr".
-    if "last_frame_nr" = 0 then this is a new frame.
+    Original mapping is used for reading the data and must include "frame_nr","cell_nr","position_x","position_y","last_frame_nr".
+    if "last_frame_nr" = 0 then this is a new cell.
     """
 
     map_name = {"frame_nr": 0, "cell_nr": 1, "position_x": 2, "position_y": 3, "unique_id": 1}
     original_map = {"frame_nr": 0, "cell_nr": 1, "position_x": 2, "position_y": 3, "last_frame_nr": 4}
 
+    def configuration(self):
+        return CSVCellParser.configuration(self) + repr(sorted(self.__class__.original_map.items()))
+
+    def used_columns(self):
+        return sorted(set(self.original_map.values()))
+
     def get_original_column(self, value_name):
         return self.original_columns[self.original_map[value_name]]
 
     def set_original_line(self, line):
-        self.original_columns = [col.replace(",", ".").strip() for col in list(csv.reader([line]))[0]]
+        self.original_columns = self.split_used_line(line, max(self.original_map.values()) + 1, csv.excel)
 
     def parse_original_line(self, line):
         self.set_original_line(line)
@@ -303,50 +508,49 @@ class TrackingLinkParser(CSVCellParser):
         Args::
             lines - [string] including all the data from a file to parse
         Returns:: 
-            [Cell]
+            CellTable
         """
         self.csv_dialect = None
         if self.is_csv_header(lines[0]):
             self.configure(lines[0])
             lines = lines[1:]
-        preprocessed_lines = [CSVCellParser.csv_line(self, data) for data in self.preprocess(lines)]
-        return CSVCellParser.parse(self, [CSVCellParser.csv_line(self, self.map_name.keys())] + preprocessed_lines)
-
-    def preprocess(self, lines):
+        # original data is always read as the default csv (as parse_original_line does)
+        columns = self.split_columns(lines, self.used_columns(), csv.excel)
+
+        def column(name, dtype):
+            return np.array(columns[self.original_map[name]], dtype=dtype)
+
+        frame_nr = column("frame_nr", np.int64)
+        (cell_nr, last_frame_nr) = (column("cell_nr", np.int64), column("last_frame_nr", np.int64))
+        # consecutive rows of the same frame
+        bounds = np.concatenate([[0], np.flatnonzero(frame_nr[1:] != frame_nr[:-1]) + 1, [len(frame_nr)]])
+        linker = TrackingLinker()
+        unique_id = np.concatenate([np.zeros(0, dtype=np.int64)] +
+                                   [linker.link(frame_nr[start], cell_nr[start:end], last_frame_nr[start:end])
+                                    for (start, end) in zip(bounds[:-1], bounds[1:]) if end > start])
+        linker.print_summary()
+
+        found = unique_id > 0
+        return CellTable(frame_nr[found], unique_id[found], unique_id[found],
+                         column("position_x", np.float64)[found], column("position_y", np.float64)[found],
+                         np.zeros(np.count_nonzero(found), dtype=np.int64))
+
+    def iterate(self, lines):
         """
+        Lazy version of parse, only the cells of the current and the previous frame are kept.
         Returns::
-            [(frame_nr, unique_id, position_x, position_y)]
-        """
-        count = 1
-        splits = 0
-        frames_grouped = itertools.groupby([self.parse_original_line(line) for line in lines], lambda x: x[0])
-        results = []
-        last_cells = dict()
-        # current cell id -> general cell id
-        new_cells = dict()
-        for (frame, cells) in frames_grouped:
-            last_cells = new_cells
-            new_cells = dict()
-            for (f, cid, x, y, lastid) in cells:
-                if lastid == 0:
-                    new_cells[cid] = count
-                    results.append((f, new_cells[cid], x, y))
-                    count = count + 1
-                else:
-                    if lastid in last_cells:  # propagate cell id
-                        if last_cells[lastid] in new_cells.values():
-                            splits = splits + 1
-                            new_cells[cid] = count
-                            count = count + 1
-                        else:
-                            new_cells[cid] = last_cells[lastid]
-                        results.append((f, new_cells[cid], x, y))
-                    else:
-                        print("".join(["CELL NOT IN THE PREVIOUS FRAME??"]))
-                        print("{} {} {}".format(frame, lastid, last_cells))
-        if splits > 0:
-            print("Number of splits (unhandled yet): {}".format(splits))
-        return results
+            generator of (frame_nr, Cell)
+        """
+        linker = TrackingLinker()
+        original_lines = (self.parse_original_line(line) for line in self.data_lines(lines))
+        for (frame, frame_lines) in itertools.groupby(original_lines, lambda x: x[0]):
+            (_, cell_nr, position_x, position_y, last_frame_nr) = zip(*frame_lines)
+            unique_id = linker.link(frame, np.array(cell_nr, dtype=np.int64),
+                                    np.array(last_frame_nr, dtype=np.int64))
+            for (i, uid) in enumerate(unique_id.tolist()):
+                if uid > 0:
+                    yield frame, CellOccurence(frame, uid, uid, (position_x[i], position_y[i]))
+        linker.print_summary()
 
 
 class CellTracerParser(TrackingLinkParser):
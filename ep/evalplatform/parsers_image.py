@@ -1,4 +1,5 @@
 import imghdr
+import os
 from abc import abstractmethod
 
 import imageio
@@ -6,10 +7,31 @@ import numpy as np
 import scipy.ndimage
 import scipy.ndimage.measurements as measures
 
-from .yeast_datatypes import CellOccurence
+from .utils import open_input, ordered_map, parse_file_order, split_archive_path, strip_compression_suffix
+from .yeast_datatypes import CellOccurence, PackedMask
+
+
+def unique_inverse(image):
+    """
+    The same as np.unique(image, return_inverse=True) but images of small unsigned values are not sorted, they
+    are looked up in the table of all possible values instead.
+    Returns::
+        (sorted values, indices of the values in the shape of the image)
+    """
+    if image.dtype.kind in "ub" and image.dtype.itemsize <= 2 and image.size > 0:
+        codes = image.view(np.uint8) if image.dtype.kind == "b" else image
+        present = np.flatnonzero(np.bincount(codes.ravel()))
+        table = np.zeros(present[-1] + 1, dtype=np.min_scalar_type(len(present)))
+        table[present] = np.arange(len(present))
+        return present.astype(image.dtype), np.take(table, codes)
+    (values, indices) = np.unique(image, return_inverse=True)
+    return values, indices.reshape(image.shape)
 
 
 class ImageCellParser:
+    loading_threads = 1  # number of images of the merged file loaded at once, read from ini file
+    mask_store = None  # MaskStore where the label images are kept (masks are copied for every cell if None)
+
     def __init__(self):
         pass
 
@@ -19,12 +41,64 @@ class ImageCellParser:
 
     @staticmethod
     def is_image(path):
-        return imghdr.what(path) is not None
+        with open_input(path, "rb") as f:
+            return imghdr.what(None, f.read(32)) is not None
+
+    @staticmethod
+    def read_image(path):
+        (_, member) = split_archive_path(path)
+        name = strip_compression_suffix(member or path)
+        if name == path:
+            return imageio.imread(path)
+        # decoded from memory, the format is chosen using the extension the same as for the files
+        with open_input(path, "rb") as f:
+            return imageio.imread(f.read(), format=os.path.splitext(name)[1])
+
+    def configuration(self):
+        """
+        Returns::
+            description of the parser settings which affect the parsed data
+        """
+        return ""
+
+    def input_files(self, path):
+        """
+        Returns::
+            [path] of all the files read when loading the given path (including images listed in merged file)
+        """
+        if self.is_image(path):
+            return [path]
+        with open_input(path) as f:
+            image_paths = f.readlines()
+        return [path] + [line.split(',')[1].strip() for line in image_paths[1:]]
+
+    @staticmethod
+    def label_measures(label_image, num_components):
+        """
+        Calculate area and center of mass of all labels in one pass.
+        Returns::
+            (areas, centers y, centers x) indexed by label
+        """
+        (height, width) = label_image.shape
+        labels = np.maximum(label_image.ravel(), 0).astype(np.intp, copy=False)
+        areas = np.bincount(labels, minlength=num_components + 1)
+        # coordinates of every pixel, the same buffer is used for both axes
+        coordinates = np.empty((height, width), dtype=np.float64)
+        coordinates[:] = np.arange(height, dtype=np.float64)[:, np.newaxis]
+        sums_y = np.bincount(labels, weights=coordinates.ravel(), minlength=num_components + 1)
+        coordinates[:] = np.arange(width, dtype=np.float64)[np.newaxis, :]
+        sums_x = np.bincount(labels, weights=coordinates.ravel(), minlength=num_components + 1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return areas, sums_y / areas, sums_x / areas
 
     def parse_labels(self, frame, label_image, label_to_colour):
         res = []
-        num_components = label_image.max()
+        num_components = int(label_image.max())
+        if num_components < 1:
+            return res
         objects = measures.find_objects(label_image, num_components)
+        (areas, centers_y, centers_x) = self.label_measures(label_image, num_components)
+        frame_masks = self.mask_store.store(label_image) if self.mask_store is not None else None
         for label in range(1, num_components + 1):
             colour = 0
             if label in label_to_colour:
@@ -34,39 +108,77 @@ class ImageCellParser:
             if label_slice is None:
                 continue
 
-            object_mask = label_image == label
-
-            # calculate center of mass
-            points_yx = np.nonzero(object_mask)
-            (y, x) = points_yx[0].mean(), points_yx[1].mean()
-
             # create result CellOcurrence
-            cell = CellOccurence(frame, label, -1, (x, y))
+            cell = CellOccurence(frame, label, -1, (centers_x[label], centers_y[label]))
             cell.colour = colour
-            cell.mask = object_mask[label_slice].copy()
             cell.mask_slice = label_slice
+            if frame_masks is not None:
+                cell.mask_source = frame_masks
+            else:
+                cell.mask = PackedMask.pack(label_image[label_slice] == label, label_slice)
+            cell._area = int(areas[label])
             res.append(cell)
         return res
 
+    def load_labels(self, path):
+        """
+        Returns::
+            (label image, {label: colour}) of the image
+        """
+        return self.image_to_labels(self.read_image(path))
+
     def load_single_image(self, frame, path):
-        image = imageio.imread(path)
-        label_image, label_to_colour = self.image_to_labels(image)
+        label_image, label_to_colour = self.load_labels(path)
         return self.parse_labels(frame, label_image, label_to_colour)
 
+    def load_label_frame(self, frame, path):
+        """
+        Returns::
+            LabelFrame of the image (None path gives frame without cells)
+        """
+        if path is None:
+            return LabelFrame(frame, np.zeros((0, 0), dtype=np.int32), {})
+        label_image, label_to_colour = self.load_labels(path)
+        return LabelFrame(frame, label_image, label_to_colour)
+
+    def listed_images(self, path):
+        """
+        Returns::
+            [(frame, image path)] of the images listed in merged file (or the image itself as frame 1)
+        """
+        if self.is_image(path):
+            return [(1, path)]
+        with open_input(path) as f:
+            image_paths = f.readlines()
+        # first line are headers
+        return [(parse_file_order(data[0].strip()), data[1].strip()) for data in
+                [line.split(',') for line in image_paths[1:]]]
+
     def load_from_merged_file(self, path):
         """
         :param path: path to merged image with list of paths to image files
         :return: all data 
         """
-        with open(path, "r") as f:
+        res = []
+        for cells in self.iterate_merged_images(path):
+            res += cells
+        return res
+
+    def iterate_merged_images(self, path):
+        """
+        Images listed in the merged file are loaded in loading_threads threads.
+        Returns::
+            generator of [Cell] of the listed images in the order of the list
+        """
+        with open_input(path) as f:
             image_paths = f.readlines()
 
-        res = []
-        # first line are headers
-        for line in image_paths[1:]:
+        def load_listed_image(line):
             data = line.split(',')
-            res += self.load_single_image(data[0].strip(), data[1].strip())
-        return res
+            return self.load_single_image(data[0].strip(), data[1].strip())
+
+        # first line are headers
+        return ordered_map(load_listed_image, image_paths[1:], self.loading_threads)
 
     def load_from_file(self, path):
         if self.is_image(path):
@@ -75,6 +187,21 @@ class ImageCellParser:
             res = self.load_from_merged_file(path)
         return [(c.frame_number, c) for c in res]
 
+    def iterate_from_merged_file(self, path):
+        """Lazy version of load_from_merged_file which loads only a few images ahead."""
+        for cells in self.iterate_merged_images(path):
+            for cell in cells:
+                yield cell
+
+    def iterate_from_file(self, path):
+        """Lazy version of load_from_file."""
+        if self.is_image(path):
+            res = self.load_single_image(1, path)
+        else:
+            res = self.iterate_from_merged_file(path)
+        for c in res:
+            yield c.frame_number, c
+
 
 class MaskImageParser(ImageCellParser):
     symbol = "MASK"
@@ -85,6 +212,9 @@ class MaskImageParser(ImageCellParser):
             facultative = []
         self.facultative_values = facultative
 
+    def configuration(self):
+        return repr(sorted(self.facultative_values))
+
     def is_facultative(self, v):
         return v in self.facultative_values
 
@@ -96,19 +226,23 @@ class MaskImageParser(ImageCellParser):
         return [(components == label) for label in range(1, num_components + 1)]
 
     def image_to_labels(self, image):
-        image_cleared = image.copy()
-        values = set(np.unique(image_cleared))
+        (values_array, value_indices) = unique_inverse(image)
+        values = set(values_array)
         values_relevant = set([val for val in values if self.is_relevant(val) and val != 0])
-        for val_irrelevant in values - values_relevant:
-            image_cleared[image_cleared == val_irrelevant] = 0
 
+        # only relevant values are labelled (separately so that touching objects of different values are not
+        # joined), labels are moved by the number of the objects of the values labelled earlier
+        # the value mask and its labels are written into the same buffers for every value
+        value_order = dict([(val, i) for (i, val) in enumerate(values_array.tolist())])
         number = 0
         components = np.zeros(image.shape, dtype=np.int32)
+        value_mask = np.empty(image.shape, dtype=bool)
+        comp = np.empty(image.shape, dtype=np.int32)
         colours = {}
         for val in values_relevant:
-            comp, num_comp = scipy.ndimage.label(image_cleared == val, np.ones((3, 3)))
-            comp[comp != 0] += number
-            components += comp
+            np.equal(value_indices, value_order[val], out=value_mask)
+            num_comp = scipy.ndimage.label(value_mask, np.ones((3, 3)), output=comp)
+            np.add(comp, number, out=components, where=value_mask)
 
             for num in range(number + 1, number + 1 + num_comp):
                 colour = 0
@@ -120,27 +254,60 @@ class MaskImageParser(ImageCellParser):
         return components, colours
 
 
+class LabelFrame(object):
+    """Cells of one frame as label image and arrays of their data (the cell_id is the label), used to evaluate
+    label images without creating the cell objects.
+
+    Attributes:
+        labels - labels of the cells in the image (ascending as the cells created by parse_labels)
+        position_x, position_y, colour - arrays with the data of the cells in the order of labels
+    """
+
+    def __init__(self, frame, label_image, label_to_colour):
+        self.frame = frame
+        self.label_image = np.maximum(label_image, 0) if label_image.size and label_image.min() < 0 else label_image
+        num_components = int(self.label_image.max()) if self.label_image.size else 0
+        if num_components < 1:
+            self.labels = np.zeros(0, dtype=np.int64)
+            (self.position_x, self.position_y, self.colour) = (np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64))
+            return
+
+        (areas, centers_y, centers_x) = ImageCellParser.label_measures(self.label_image, num_components)
+        self.labels = np.flatnonzero(areas[1:]) + 1
+        self.position_x = centers_x[self.labels]
+        self.position_y = centers_y[self.labels]
+        colours = np.zeros(num_components + 1, dtype=np.int64)
+        for (label, colour) in label_to_colour.items():
+            if 0 < label <= num_components:
+                colours[label] = colour
+        self.colour = colours[self.labels]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def cell(self, index):
+        """
+        Returns::
+            CellOccurence (without mask) of the index-th cell
+        """
+        label = int(self.labels[index])
+        return CellOccurence(self.frame, label, -1, (self.position_x[index], self.position_y[index]),
+                             int(self.colour[index]))
+
+
 class LabelImageParser(ImageCellParser):
     symbol = "LABEL"
 
     def parse_image(self, image):
-        values = np.unique(image)
-        # remap labels to [1..] values
-        curr = 1
-        label_image = image.copy()
-        for v in values[1:]:  # zero is ignored
-            label_image[image == v] = curr
-            curr += 1
-        return label_image
+        return self.image_to_labels(image)[0]
 
     def image_to_labels(self, image):
-        curr = 1
-        label_image = image.copy()
-        values = np.unique(image)
-        colours = {}
-        for v in values[1:]:  # zero is ignored
-            label_image[image == v] = curr
-            colours[curr] = 0
-            curr += 1
+        (values, value_indices) = unique_inverse(image)
+        if len(values) == 0:
+            return image.copy(), {}
 
-        return label_image, colours
+        # remap labels to [1..] values, the smallest value (zero) is ignored
+        labels = np.arange(len(values)).astype(image.dtype)
+        labels[0] = values[0]
+        colours = dict([(label, 0) for label in range(1, len(values))])
+        return labels[value_indices], colours
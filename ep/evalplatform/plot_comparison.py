@@ -1,14 +1,24 @@
 from __future__ import division  # so that a / b == float(a) / b
 
+import copy
+import itertools
+import multiprocessing
+from collections import defaultdict
+
 import fire
+import numpy as np
 
 from ep.evalplatform import draw_details
 from ep.evalplatform.compatibility import plot_comparison_legacy_parse
+from ep.evalplatform.input_cache import InputCache
+from ep.evalplatform.mask_store import MaskStore, release_masks
+from ep.evalplatform.matching import candidate_pairs, common_shape_labels, optimal_matching, OverlapTable
+from ep.evalplatform.tracking import TrackingTable
 from ep.evalplatform.parsers import *
 from ep.evalplatform.parsers_image import *
 from ep.evalplatform.plotting import Plotter
 from ep.evalplatform.utils import *
-from ep.evalplatform.yeast_datatypes import CellOccurence
+from ep.evalplatform.yeast_datatypes import CellOccurence, CellTable
 
 SEGMENTATION_GNUPLOT_FILE = "plot_segmentation.plt"
 TRACKING_GNUPLOT_FILE = "plot_tracking.plt"
@@ -25,6 +35,8 @@ ground_truth_parser = OldGroundTruthParser()
 loaded_ini = False
 cutoff = 30  # pixels
 cutoff_iou = 0.3  # intersection / union
+matching_method = "greedy"  # one of MATCHING_METHODS
+MATCHING_METHODS = ["greedy", "optimal"]
 output_evaluation_details = 0
 draw_evaluation_details = 0
 fill_markers = False
@@ -32,9 +44,27 @@ markersize = 7
 ignored_frame_size = 0
 all_data_evaluated = 0
 wide_plots = 0
+input_cache = None  # InputCache used to read parsed input files (if cache directory is configured)
+
+# configuration used in segmentation evaluation which is passed to the worker processes
+WORKER_SETTINGS = ["CONFIG_FILE", "loaded_ini", "cutoff", "cutoff_iou", "matching_method", "ignored_frame_size",
+                   "output_evaluation_details"]
+
+
+def border_flags(position_x, position_y, obligatory, image_size):
+    """
+    Returns::
+        array which is True for the cells (given in arrays) that are not obligatory or close to the border
+    """
+    inside = ((ignored_frame_size <= position_x) & (position_x <= image_size[0] - ignored_frame_size) &
+              (ignored_frame_size <= position_y) & (position_y <= image_size[1] - ignored_frame_size))
+    return ~obligatory | ~inside
 
 
 def filter_border(celllist, image_size=(10000, 10000)):
+    if isinstance(celllist, CellTable):
+        positions = celllist.positions()
+        return celllist.select(border_flags(positions[:, 0], positions[:, 1], celllist.obligatory(), image_size))
     if celllist == []:
         return []
     if isinstance(celllist[0], CellOccurence):
@@ -49,6 +79,13 @@ def filter_border(celllist, image_size=(10000, 10000)):
         print (celllist)
 
 
+def load_cells(path, parser):
+    """Load cells with the parser or from the input cache if it is enabled."""
+    if input_cache is not None:
+        return input_cache.load(path, parser)
+    return parser.load_from_file(path)
+
+
 def read_ground_truth(path, parser=None):
     """
     Returns::
@@ -57,12 +94,72 @@ def read_ground_truth(path, parser=None):
     parser = parser or ground_truth_parser
     debug_center.show_in_console(None, "Progress", "Reading ground truth data...")
     debug_center.show_in_console(None, "Tech", "".join(["Uses ", parser.__class__.__name__, " parser..."]))
-    cells = parser.load_from_file(path)
+    cells = load_cells(path, parser)
     debug_center.show_in_console(None, "Progress", "Done reading ground truth data...")
     return cells
 
 
+def group_by_frame(frame_cells):
+    """
+    Input: [(frame, Cell)] or CellTable
+    Returns::
+        {frame: [Cell]} with cells in the input order ({frame: CellTable} for CellTable)
+    """
+    if isinstance(frame_cells, CellTable):
+        return frame_cells.group_by_frame()
+    cells_per_frame = defaultdict(list)
+    for (frame, cell) in frame_cells:
+        cells_per_frame[frame].append(cell)
+    return dict(cells_per_frame)
+
+
+def iterate_by_frame(frame_cells):
+    """
+    Group stream of cells sorted by frame.
+    Input: generator of (frame, Cell)
+    Returns::
+        generator of (frame, [Cell])
+    """
+    last_frame = None
+    for (frame, group) in itertools.groupby(frame_cells, lambda frame_cell: frame_cell[0]):
+        if last_frame is not None and frame <= last_frame:
+            raise Exception("Data is not sorted by frame: frame {0} is after frame {1}.".format(frame, last_frame))
+        last_frame = frame
+        yield frame, [cell for (_, cell) in group]
+
+
+def join_frames(ground_truth_frames, results_frames, all_frames=False):
+    """
+    Merge-join ground truth and results streams of (frame, [Cell]) sorted by frame.
+    all_frames - if frames present in only one of the streams are used as well (without cells from the other one)
+    Returns::
+        generator of (frame, ([Cell], [Cell]))
+    """
+    ground_truth_frames = iter(ground_truth_frames)
+    results_frames = iter(results_frames)
+    ground_truth = next(ground_truth_frames, None)
+    results = next(results_frames, None)
+    while ground_truth is not None or results is not None:
+        if not all_frames and (ground_truth is None or results is None):
+            break
+        if results is None or (ground_truth is not None and ground_truth[0] < results[0]):
+            if all_frames:
+                yield ground_truth[0], (ground_truth[1], [])
+            ground_truth = next(ground_truth_frames, None)
+        elif ground_truth is None or results[0] < ground_truth[0]:
+            if all_frames:
+                yield results[0], ([], results[1])
+            results = next(results_frames, None)
+        else:
+            yield ground_truth[0], (ground_truth[1], results[1])
+            ground_truth = next(ground_truth_frames, None)
+            results = next(results_frames, None)
+
+
 def make_all_cells_important(frame_cells):
+    if isinstance(frame_cells, CellTable):
+        frame_cells.set_colour(0)
+        return
     for frame_cell in frame_cells:
         frame_cell[1].colour = 0
 
@@ -74,7 +171,7 @@ def read_results(path, parser, name):
     """
     debug_center.show_in_console(None, "Progress", "".join(["Reading ", name, " results data..."]))
     debug_center.show_in_console(None, "Tech", "".join(["Uses ", parser.__class__.__name__, " parser..."]))
-    cells = parser.load_from_file(path)
+    cells = load_cells(path, parser)
     make_all_cells_important(cells)  # cells cannot use colour temporary
     debug_center.show_in_console(None, "Progress", "".join(["Done reading ", name, " result data..."]))
     return name, cells
@@ -103,8 +200,14 @@ def write_to_file_segmentation(stats, path):
 
 def write_to_file_printable(details, path):
     if details:
-        headers = details[0].csv_headers()
-        records = [d.csv_record() for d in details]
+        write_records_printable(details[0].csv_headers(), [d.csv_record() for d in details], path)
+    else:
+        write_records_printable(None, [], path)
+
+
+def write_records_printable(headers, records, path):
+    """Write details which are already converted to csv records."""
+    if records:
         write_to_csv(headers, records, path)
     else:
         write_to_csv(["No details!"], [], path)
@@ -136,14 +239,48 @@ def distance(cell_a, cell_b):
     return ((cell_a.position[0] - cell_b.position[0]) ** 2 + (cell_a.position[1] - cell_b.position[1]) ** 2) ** 0.5
 
 
-def find_correspondence(ground_truth, results):
+def matching_weight(similarity, cell_gt, cell_algo):
+    """Positive weight of the match: iou or how much closer than cutoff the cells are."""
+    if cell_gt.has_contour_data() and cell_algo.has_contour_data():
+        return similarity
+    return cutoff + similarity
+
+
+def similarity_edges(ground_truth, results, overlaps=None):
+    """
+    Find all the pairs of cells which are similar enough to be matched.
+    If overlaps (OverlapTable of the cells) is given the ious are read from it, otherwise the distances are used.
+    Returns::
+        [(similarity, (ground_truth_cell, results_cell))]
     """
-    Greadily match if distance close enough
+    if overlaps is not None:
+        edges = []
+        for (g, r) in overlaps.pairs():
+            iou = overlaps.iou(g, r)
+            if iou > cutoff_iou:
+                edges.append((iou, (ground_truth[g - 1], results[r - 1])))
+    else:
+        pairs = [(ground_truth[g], results[r]) for (g, r) in candidate_pairs(ground_truth, results, cutoff)]
+        edges = [(d, (g, r)) for (d, (g, r)) in
+                 [(g.similarity_if_similar(r, cutoff, cutoff_iou), (g, r)) for (g, r) in pairs] if d is not None]
+    return edges
+
+
+def find_correspondence(ground_truth, results, overlaps=None):
+    """
+    Greadily match if distance close enough (or find maximum weight matching if optimal matching is chosen)
     Input: [Cell] x2
+    If all the cells have contours the ious are read from OverlapTable (created if not provided).
     Matching:
     [(ground_truth_cell, results_cell)]  -> can easily calculate false positives/negatives and cell count + tracking
     """
-    edges = [(g.similarity(r), (g, r)) for g in ground_truth for r in results if g.is_similar(r, cutoff, cutoff_iou)]
+    if overlaps is None:
+        overlaps = OverlapTable.from_cells(ground_truth, results)
+    edges = similarity_edges(ground_truth, results, overlaps)
+
+    if matching_method == "optimal":
+        return optimal_matching([(matching_weight(d, a, b), (a, b)) for (d, (a, b)) in edges])
+
     correspondences = []
     matchedGT = set([])
     matchedRes = set([])
@@ -158,9 +295,45 @@ def find_correspondence(ground_truth, results):
     return correspondences
 
 
-def calculate_stats_segmentation(ground_truth_frame, results_frame, image_size=(100000, 100000)):
+class CorrespondenceCache(object):
+    """Matching of every frame calculated once and kept until the frame is evicted.
+
+    Frame matching is reused as long as it is requested for the same (equal) ground truth and results cells.
+    """
+
+    def __init__(self):
+        self.frames = {}
+
+    def get(self, frame, ground_truth, results):
+        """
+        Returns::
+            (correspondence, overlaps) - matching of the frame and OverlapTable used for it (or None)
+        """
+        cached = self.frames.get(frame)
+        if cached is None or cached[0] != ground_truth or cached[1] != results:
+            overlaps = OverlapTable.from_cells(ground_truth, results)
+            cached = (ground_truth, results, (find_correspondence(ground_truth, results, overlaps), overlaps))
+            self.frames[frame] = cached
+        return cached[2]
+
+    def put(self, frame, ground_truth, results, correspondence, overlaps=None):
+        """Store matching of the frame calculated elsewhere."""
+        self.frames[frame] = (ground_truth, results, (correspondence, overlaps))
+
+    def evict(self, frame):
+        self.frames.pop(frame, None)
+
+    def retain(self, frames):
+        """Evict all frames but the given ones."""
+        for frame in set(self.frames) - set(frames):
+            self.evict(frame)
+
+
+def calculate_stats_segmentation(ground_truth_frame, results_frame, image_size=(100000, 100000), matching=None):
     """
     Input: [Cell] x2
+    matching - (correspondence, overlaps) of the frame if it was already calculated
+    Border, matched and unmatched cells are kept in sets so it is linear in the number of cells.
     Result: (cell_count_results, cell_count_ground_truth, correspondences, false_positives, false_negatives)
     """
     load_general_ini(CONFIG_FILE)
@@ -173,17 +346,29 @@ def calculate_stats_segmentation(ground_truth_frame, results_frame, image_size=(
     for c in border_groundtruth:
         c.colour = 1
 
-    correspondence = find_correspondence(ground_truth_frame, results_frame)
-    border_correspondence = filter_border(correspondence, image_size)
+    if matching is None:
+        overlaps = OverlapTable.from_cells(ground_truth_frame, results_frame)
+        correspondence = find_correspondence(ground_truth_frame, results_frame, overlaps)
+    else:
+        (correspondence, overlaps) = matching
+
+    # sets are created after border marking as it changes the hash of the cells
+    border_results = set(border_results)
+    border_groundtruth = set(border_groundtruth)
+    border_correspondence = set(filter_border(correspondence, image_size))
 
-    matched_GT = [gt for gt, _ in correspondence]
-    matched_res = [res for _, res in correspondence]
+    matched_GT = set([gt for gt, _ in correspondence])
+    matched_res = set([res for _, res in correspondence])
 
-    matched_border_GT = [gt for gt, _ in border_correspondence]
-    matched_border_res = [res for _, res in border_correspondence]
+    matched_border_GT = set([gt for gt, _ in border_correspondence])
+    matched_border_res = set([res for _, res in border_correspondence])
 
-    correct_results = [SegmentationResult(gt, res) for (gt, res) in correspondence if
-                       (gt, res) not in border_correspondence]
+    # ious are read by the indices of the cells in the frames which the table was created for
+    ground_truth_index = dict([(id(cell), i) for i, cell in enumerate(ground_truth_frame)])
+    results_index = dict([(id(cell), i) for i, cell in enumerate(results_frame)])
+    correct_results = [SegmentationResult(gt, res, overlaps and overlaps.index_iou(ground_truth_index[id(gt)],
+                                                                                   results_index[id(res)]))
+                       for (gt, res) in correspondence if (gt, res) not in border_correspondence]
     obligatory_results = [res for res in results_frame if res not in border_results and res not in matched_border_res]
     obligatory_gt = [gt for gt in ground_truth_frame if gt not in border_groundtruth and gt not in matched_border_GT]
     false_negatives = [SegmentationResult(gt, None) for gt in ground_truth_frame if
@@ -197,6 +382,137 @@ def calculate_stats_segmentation(ground_truth_frame, results_frame, image_size=(
             false_negatives)
 
 
+def evaluate_segmentation_frame(frame_task):
+    """
+    Evaluate segmentation of a single frame, it can be run in a worker process.
+    Input: (ground_truth_frame, results_frame, image_size)
+    Result: (segmentation_stats, correspondence, border_results)
+        segmentation_stats - result of calculate_stats_segmentation
+        correspondence - [(ground_truth_index, results_index)] matching of the frame
+        border_results - indices of the results cells marked as border ones
+    """
+    (ground_truth_frame, results_frame, image_size) = frame_task
+    overlaps = OverlapTable.from_cells(ground_truth_frame, results_frame)
+    correspondence = find_correspondence(ground_truth_frame, results_frame, overlaps)
+    ground_truth_index = dict([(id(cell), i) for i, cell in enumerate(ground_truth_frame)])
+    results_index = dict([(id(cell), i) for i, cell in enumerate(results_frame)])
+    correspondence_indices = [(ground_truth_index[id(gt)], results_index[id(res)]) for (gt, res) in correspondence]
+
+    ground_truth_colours = [cell.colour for cell in ground_truth_frame]
+    results_colours = [cell.colour for cell in results_frame]
+    segmentation_stats = calculate_stats_segmentation(ground_truth_frame, results_frame, image_size,
+                                                      (correspondence, overlaps))
+    # ground truth cells are reused in tracking evaluation so they cannot stay marked as border cells
+    for (cell, colour) in zip(ground_truth_frame, ground_truth_colours):
+        cell.colour = colour
+    border_results = [i for i, (cell, colour) in enumerate(zip(results_frame, results_colours)) if
+                      cell.colour != colour]
+    return segmentation_stats, correspondence_indices, border_results
+
+
+def evaluate_segmentation_labels(frame_task):
+    """
+    Evaluate segmentation of a single frame given as label images the same way as evaluate_segmentation_frame
+    does for their cells, but on the arrays of LabelFrame. Cells are created only for the evaluation details.
+    Input: (ground_truth LabelFrame, results LabelFrame, image_size)
+    Result: (segmentation_stats, correspondence, border_results) as in evaluate_segmentation_frame, if the details
+        are not outputted correct, false positives and false negatives in segmentation_stats are just indices
+    """
+    (ground_truth, results, image_size) = frame_task
+    overlaps = OverlapTable(*common_shape_labels(ground_truth.label_image, results.label_image))
+    ious = overlaps.pair_ious()
+    chosen = np.nonzero(ious > cutoff_iou)[0]
+    # pairs are sorted by labels which are in the order of the cells
+    edge_ious = ious[chosen]
+    edge_ground_truth = np.searchsorted(ground_truth.labels, overlaps.pair_ground_truth[chosen])
+    edge_results = np.searchsorted(results.labels, overlaps.pair_results[chosen])
+
+    if matching_method == "optimal":
+        correspondence = optimal_matching(list(zip(edge_ious.tolist(), zip(edge_ground_truth.tolist(),
+                                                                           edge_results.tolist()))))
+    else:
+        # the same greedy matching as in find_correspondence
+        correspondence = []
+        matched_ground_truth = set()
+        matched_results = set()
+        for edge in np.argsort(-edge_ious, kind="stable").tolist():
+            (g, r) = (int(edge_ground_truth[edge]), int(edge_results[edge]))
+            if r not in matched_results:
+                if g not in matched_ground_truth:
+                    correspondence.append((g, r))
+                    matched_ground_truth.add(g)
+                matched_results.add(r)
+    edge_iou = dict(zip(zip(edge_ground_truth.tolist(), edge_results.tolist()), edge_ious.tolist()))
+
+    # all the results cells are obligatory (see make_all_cells_important)
+    ground_truth_border = border_flags(ground_truth.position_x, ground_truth.position_y, ground_truth.colour == 0,
+                                       image_size)
+    results_border = border_flags(results.position_x, results.position_y, np.ones(len(results), dtype=bool),
+                                  image_size)
+
+    pairs = np.array(correspondence, dtype=np.int64).reshape(-1, 2)
+    pair_border = ground_truth_border[pairs[:, 0]] | results_border[pairs[:, 1]]
+    matched_ground_truth = np.zeros(len(ground_truth), dtype=bool)
+    matched_ground_truth[pairs[:, 0]] = True
+    matched_results = np.zeros(len(results), dtype=bool)
+    matched_results[pairs[:, 1]] = True
+    border_matched_ground_truth = np.zeros(len(ground_truth), dtype=bool)
+    border_matched_ground_truth[pairs[pair_border, 0]] = True
+    border_matched_results = np.zeros(len(results), dtype=bool)
+    border_matched_results[pairs[pair_border, 1]] = True
+
+    obligatory_results = int(np.count_nonzero(~results_border & ~border_matched_results))
+    obligatory_gt = int(np.count_nonzero(~ground_truth_border & ~border_matched_ground_truth))
+    correct_results = [(g, r) for ((g, r), border) in zip(correspondence, pair_border.tolist()) if not border]
+    false_positives = np.nonzero(~results_border & ~matched_results)[0].tolist()
+    false_negatives = np.nonzero(~ground_truth_border & ~matched_ground_truth)[0].tolist()
+    if output_evaluation_details:
+        correct_results = [SegmentationResult(ground_truth.cell(g), results.cell(r), edge_iou[(g, r)])
+                           for (g, r) in correct_results]
+        false_positives = [SegmentationResult(None, results.cell(r)) for r in false_positives]
+        false_negatives = [SegmentationResult(ground_truth.cell(g), None) for g in false_negatives]
+
+    segmentation_stats = (obligatory_results, obligatory_gt, correct_results, false_positives, false_negatives)
+    return segmentation_stats, correspondence, np.nonzero(results_border)[0].tolist()
+
+
+def configure_worker(settings):
+    """Set up worker process with the configuration snapshot of the main process."""
+    globals().update(settings)
+
+
+def evaluate_segmentation_frames(frame_tasks, workers=1, batch_size=None, evaluate=evaluate_segmentation_frame):
+    """
+    Evaluate segmentation of all the frames using evaluate_segmentation_frame (or evaluate_segmentation_labels).
+    If more than one worker is requested frames are evaluated in a process pool.
+    Args::
+        frame_tasks - iterable of evaluate inputs
+        batch_size - number of frames sent to the pool at once (all by default)
+    Returns::
+        generator of evaluate results in the order of frame_tasks
+    """
+    frame_tasks = iter(frame_tasks)
+    if workers <= 1:
+        for task in frame_tasks:
+            yield evaluate(task)
+        return
+
+    settings = dict([(name, globals()[name]) for name in WORKER_SETTINGS])
+    pool = multiprocessing.Pool(workers, initializer=configure_worker, initargs=(settings,))
+    try:
+        while True:
+            batch = list(itertools.islice(frame_tasks, batch_size))
+            if not batch:
+                break
+            # a few chunks per worker so that the load stays balanced while the overhead is low
+            chunksize = max(1, len(batch) // (workers * 4))
+            for result in pool.map(evaluate, batch, chunksize):
+                yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def calculate_precision_recall_F_metrics(algorithm_number, real_number, correct_number):
     """
     Result: (precision, recall, F)
@@ -231,48 +547,65 @@ def calculate_stats_tracking(params_last, last_mapping, params_new, new_mapping)
     """
     (found_links, real_links, correct_links, false_positive, false_negative)
     1 to 1 correspondence version
+    Cells are indexed by unique_id (and results cells by their matched GT cells) so it is linear in number of cells.
     """
     (last_gt, last_res) = params_last
     (new_gt, new_res) = params_new
 
+    def group_by(items, key):
+        groups = defaultdict(list)
+        for item in items:
+            groups[key(item)].append(item)
+        return groups
+
+    def matched_gt(mapping):
+        """Results cell -> first GT cell matched with it."""
+        matched = {}
+        for (gt, res) in mapping:
+            matched.setdefault(res, gt)
+        return matched
+
+    def links(last_cells, new_cells):
+        """Links between cells with the same unique_id."""
+        new_by_id = group_by(new_cells, lambda c: c.unique_id)
+        return [TrackingLink(last, new) for last in last_cells for new in new_by_id.get(last.unique_id, [])]
+
     # ignore non obligatory GT cells
     last_gt = [c for c in last_gt if c.obligatory()]
     new_gt = [c for c in new_gt if c.obligatory()]
 
     # leaves only cell from results the ones matched with the obligatory cells or not matched at all
-    last_res = [c for c in last_res if (last_mapping == [] or (c not in list(zip(*last_mapping))[1])) or (
-        list(zip(*last_mapping))[0][
-            list(zip(*last_mapping))[1].index(c)].obligatory())]  # searches in [(a,b)] for the a when given b.
-    new_res = [c for c in new_res if (new_mapping == [] or (c not in list(zip(*new_mapping))[1])) or (
-        list(zip(*new_mapping))[0][list(zip(*new_mapping))[1].index(c)].obligatory())]
+    last_matched_gt = matched_gt(last_mapping)
+    last_res = [c for c in last_res if c not in last_matched_gt or last_matched_gt[c].obligatory()]
+    new_matched_gt = matched_gt(new_mapping)
+    new_res = [c for c in new_res if c not in new_matched_gt or new_matched_gt[c].obligatory()]
 
-    # ignore mapping connected to the non-obligatory GT cells 
+    # ignore mapping connected to the non-obligatory GT cells
     last_mapping = [(gt, res) for (gt, res) in last_mapping if gt.obligatory()]
     new_mapping = [(gt, res) for (gt, res) in new_mapping if gt.obligatory()]
 
     # find links and make pairs of cells in results with the same unique_id in GT
-    number_change = [(last[1], new[1], last[0], new[0]) for last in last_mapping for new in new_mapping if
-                     last[0].unique_id == new[0].unique_id]
-    correct_links = [(TrackingLink(l_res, n_res), TrackingLink(l_gt, n_gt)) for (l_res, n_res, l_gt, n_gt) in
-                     number_change
+    new_mapping_by_id = group_by(new_mapping, lambda m: m[0].unique_id)
+    correct_links = [(TrackingLink(l_res, n_res), TrackingLink(l_gt, n_gt))
+                     for (l_gt, l_res) in last_mapping for (n_gt, n_res) in new_mapping_by_id.get(l_gt.unique_id, [])
                      if l_res.unique_id == n_res.unique_id]
 
     # find the number of existing links
-    real_links = [TrackingLink(last, new) for last in last_gt for new in new_gt if last.unique_id == new.unique_id]
-    found_links = [TrackingLink(last, new) for last in last_res for new in new_res if last.unique_id == new.unique_id]
+    real_links = links(last_gt, new_gt)
+    found_links = links(last_res, new_res)
 
+    correct_res_links = set([link_res for (link_res, _) in correct_links])
+    correct_gt_links = set([link_gt for (_, link_gt) in correct_links])
     correct_results = [TrackingResult(link_gt, link_res) for (link_res, link_gt) in correct_links]
-    false_negatives = [TrackingResult(gt, None) for gt in real_links if
-                       correct_links == [] or gt not in list(zip(*correct_links))[1]]
-    false_positives = [TrackingResult(None, res) for res in found_links if
-                       correct_links == [] or res not in list(zip(*correct_links))[0]]
+    false_negatives = [TrackingResult(gt, None) for gt in real_links if gt not in correct_gt_links]
+    false_positives = [TrackingResult(None, res) for res in found_links if res not in correct_res_links]
 
     return found_links, real_links, correct_results, false_positives, false_negatives  # evaluation_details
 
 
 def load_general_ini(path):
     global cutoff, cutoff_iou, draw_evaluation_details, ignored_frame_size, \
-        loaded_ini, fill_markers, markersize, all_data_evaluated
+        loaded_ini, fill_markers, markersize, all_data_evaluated, matching_method
 
     if read_ini(path, 'evaluation', 'maxmatchdistance') != '':
         cutoff = float(read_ini(path, 'evaluation', 'maxmatchdistance'))
@@ -284,6 +617,12 @@ def load_general_ini(path):
         ignored_frame_size = float(read_ini(path, 'evaluation', 'ignoredframesize'))
     if read_ini(path, 'evaluation', 'alldataevaluated') != '':
         all_data_evaluated = bool(int(read_ini(path, 'evaluation', 'alldataevaluated')))
+    if read_ini(path, 'evaluation', 'matching') != '':
+        matching = read_ini(path, 'evaluation', 'matching').strip().lower()
+        if matching not in MATCHING_METHODS:
+            raise Exception("Unknown matching method: {0}, it has to be one of: {1}.".format(
+                matching, ", ".join(MATCHING_METHODS)))
+        matching_method = matching
 
     if read_ini(path, 'details', 'fill_markers') != '':
         fill_markers = bool(int(read_ini(path, 'details', 'fill_markers')))
@@ -291,11 +630,29 @@ def load_general_ini(path):
         markersize = int(read_ini(path, 'details', 'markersize'))
 
 
+def configure_input(path):
+    """Set up reading of the input files (cache, image loading threads and mask store), done once per run."""
+    global input_cache
+
+    if read_ini(path, 'cache', 'directory').strip() != '':
+        cache_size = 1024
+        if read_ini(path, 'cache', 'maxsize') != '':
+            cache_size = float(read_ini(path, 'cache', 'maxsize'))
+        input_cache = InputCache(read_ini(path, 'cache', 'directory').strip(), cache_size * 1024 * 1024)
+
+    if read_ini(path, 'input', 'threads') != '':
+        ImageCellParser.loading_threads = int(read_ini(path, 'input', 'threads'))
+    mask_directory = read_ini(path, 'input', 'maskdirectory').strip()
+    if mask_directory != '' and (ImageCellParser.mask_store is None or
+                                 ImageCellParser.mask_store.root != mask_directory):
+        ImageCellParser.mask_store = MaskStore(mask_directory)
+
+
 def run(ground_truth_csv_file,
         algorithm_results_csv_file, algorithm_results_type, algorithm_name=None,
         ground_truth_seg_csv_file=None, ground_truth_special_parser=None,
         input_directory=None, input_file_part=None,
-        evaluate_tracking=True, output_summary_stdout=False):
+        evaluate_tracking=True, output_summary_stdout=False, workers=1, streaming=False):
     global ground_truth_parser, output_evaluation_details, wide_plots
 
     input_file_part = input_file_part or ""
@@ -305,6 +662,7 @@ def run(ground_truth_csv_file,
     ground_truth_seg_csv_file = ground_truth_seg_csv_file or ground_truth_csv_file
 
     load_general_ini(CONFIG_FILE)
+    configure_input(CONFIG_FILE)
     if read_ini(CONFIG_FILE, 'evaluation', 'outputevaluationdetails') != '':
         output_evaluation_details = float(read_ini(CONFIG_FILE, 'evaluation', 'outputevaluationdetails'))
     if read_ini(CONFIG_FILE, 'plot', 'terminal') != '':
@@ -324,48 +682,135 @@ def run(ground_truth_csv_file,
 
     debug_center.show_in_console(None, "Info", "".join(["Algorithm name: ", algorithm_name]))
     filtered_algorithm_name = ''.join([c for c in algorithm_name if c.isalnum()])
+    # outputs of the results read from an archive are written next to the archive
+    output_path_base = flat_input_path(algorithm_results_csv_file) + "." + filtered_algorithm_name
 
-    results_data = read_results(algorithm_results_csv_file, parser, algorithm_name)
+    def exit_no_data():
+        debug_center.show_in_console(None, "Error",
+                                     "ERROR: No ground truth data! Intersection of ground truth and results is empty!")
+        sys.exit()
 
-    def read_GT(ground_truth_csv_file, tracking=False):
-        ground_truth_data = read_ground_truth(ground_truth_csv_file)
-        # filter data without tracking GT
-        if tracking:
-            ground_truth_data = [(f, cell) for (f, cell) in ground_truth_data if cell.has_tracking_data()]
+    # segmentation of label images is evaluated on the arrays without creating the cells
+    labels_evaluated = (not evaluate_tracking and isinstance(parser, ImageCellParser) and
+                        isinstance(ground_truth_parser, ImageCellParser))
+    if not streaming and not labels_evaluated:
+        results_data = read_results(algorithm_results_csv_file, parser, algorithm_name)
+        results_per_frame = group_by_frame(results_data[1])
+    ground_truth_per_file = {}
 
-        # use all frames with data or just frames where both gt and algo results
-        gt_set = set([item[0] for item in ground_truth_data])
-        res_set = set([item[0] for item in results_data[1]])
+    def read_GT(ground_truth_csv_file, tracking=False):
+        # ground truth file is indexed only once even if it is used for both segmentation and tracking
+        if ground_truth_csv_file not in ground_truth_per_file:
+            ground_truth_per_file[ground_truth_csv_file] = group_by_frame(read_ground_truth(ground_truth_csv_file))
+        ground_truth_per_frame = ground_truth_per_file[ground_truth_csv_file]
+
+        def frame_table(cells_per_frame, frame):
+            cells = cells_per_frame.get(frame, [])
+            # filter data without tracking GT
+            if tracking:
+                if isinstance(cells, CellTable):
+                    return cells.select(cells.has_tracking_data())
+                return [cell for cell in cells if cell.has_tracking_data()]
+            return cells
+
+        def frame_cells(cells_per_frame, frame):
+            cells = frame_table(cells_per_frame, frame)
+            return cells.cells() if isinstance(cells, CellTable) else cells
+
+        # use all frames with data or just frames where both gt and algo results (counted without creating the cells)
+        gt_set = set([frame for frame in ground_truth_per_frame if len(frame_table(ground_truth_per_frame, frame))])
+        res_set = set(results_per_frame)
         list_of_frames = sorted(gt_set | res_set if all_data_evaluated else gt_set & res_set)
 
         if list_of_frames == []:
-            debug_center.show_in_console(None, "Error",
-                                         "ERROR: No ground truth data! Intersection of ground truth and results is empty!")
-            sys.exit()
-        data_per_frame = dict([(frame, ([g[1] for g in ground_truth_data if g[0] == frame],
-                                        [r[1] for r in results_data[1] if
-                                         r[0] == frame and not (tracking and not r[1].has_tracking_data())]))
-                               for frame in list_of_frames])
-        return ground_truth_data, list_of_frames, data_per_frame
+            exit_no_data()
+        # cells of the frame are created when it is evaluated
+        return ((frame, (frame_cells(ground_truth_per_frame, frame), frame_cells(results_per_frame, frame)))
+                for frame in list_of_frames)
+
+    def stream_GT(ground_truth_csv_file, tracking=False):
+        """Lazy version of read_GT which reads frame sorted files as the frames are evaluated."""
+        debug_center.show_in_console(None, "Progress", "Streaming ground truth and results data...")
+        # files are read at the same time so each of them needs its own parser state (header mapping etc.)
+        ground_truth_frames = iterate_by_frame(copy.copy(ground_truth_parser).iterate_from_file(ground_truth_csv_file))
+        results_frames = iterate_by_frame(copy.copy(parser).iterate_from_file(algorithm_results_csv_file))
+        if tracking:
+            ground_truth_frames = ((frame, [cell for cell in cells if cell.has_tracking_data()])
+                                   for (frame, cells) in ground_truth_frames)
+            ground_truth_frames = ((frame, cells) for (frame, cells) in ground_truth_frames if cells)
+
+        for (frame, (ground_truth, results)) in join_frames(ground_truth_frames, results_frames, all_data_evaluated):
+            for cell in results:
+                cell.colour = 0  # cells cannot use colour temporary
+            if tracking:
+                results = [cell for cell in results if cell.has_tracking_data()]
+            yield frame, (ground_truth, results)
+
+    def read_label_frames(ground_truth_csv_file):
+        """Version of read_GT which loads LabelFrame of ground truth and results images."""
+        ground_truth_images = dict(ground_truth_parser.listed_images(ground_truth_csv_file))
+        results_images = dict(parser.listed_images(algorithm_results_csv_file))
+        if all_data_evaluated:
+            candidate_frames = set(ground_truth_images) | set(results_images)
+        else:
+            candidate_frames = set(ground_truth_images) & set(results_images)
+
+        def load_frame(frame):
+            return (frame, (ground_truth_parser.load_label_frame(frame, ground_truth_images.get(frame)),
+                            parser.load_label_frame(frame, results_images.get(frame))))
 
-    ground_truth_data, list_of_frames, data_per_frame = read_GT(ground_truth_seg_csv_file)
+        # images are loaded as the frames are evaluated, frames without cells are skipped the same way as in read_GT
+        return ((frame, (ground_truth, results)) for (frame, (ground_truth, results)) in
+                ordered_map(load_frame, sorted(candidate_frames), ImageCellParser.loading_threads)
+                if (len(ground_truth) and len(results)) or (all_data_evaluated and (len(ground_truth) or len(results))))
+
+    def load_GT(ground_truth_csv_file, tracking=False):
+        if labels_evaluated:
+            return read_label_frames(ground_truth_csv_file)
+        if streaming:
+            return stream_GT(ground_truth_csv_file, tracking)
+        return read_GT(ground_truth_csv_file, tracking)
+
+    frames = load_GT(ground_truth_seg_csv_file)
 
     debug_center.show_in_console(None, "Progress", "Evaluating segmentation...")
     stats = []
-    segmentation_details = []
+    segmentation_records = []
     image_sizes = {}
+    correspondence_cache = CorrespondenceCache()
 
     if output_evaluation_details and draw_evaluation_details:
         overlord = draw_details.EvaluationDetails(SEGDETAILS_SUFFIX, input_file_part)
         image_sizes = draw_details.get_images_sizes(overlord, input_directory)
 
-    for frame in list_of_frames:
-        image_size = image_sizes.get(frame, (100000, 100000))
-
-        (cr, cg, corr, fp, fn) = calculate_stats_segmentation(data_per_frame[frame][0], data_per_frame[frame][1],
-                                                              image_size)
-        segmentation_details += (corr, fp, fn)
+    # in streaming mode (and for the label images) only a few frames are sent to the workers at once
+    (frames, evaluated_frames) = itertools.tee(frames)
+    frame_tasks = ((ground_truth, results, image_sizes.get(frame, (100000, 100000)))
+                   for (frame, (ground_truth, results)) in frames)
+    if labels_evaluated:
+        frame_evaluations = evaluate_segmentation_frames(frame_tasks, workers, workers * 4,
+                                                         evaluate_segmentation_labels)
+    else:
+        frame_evaluations = evaluate_segmentation_frames(frame_tasks, workers, workers * 4 if streaming else None)
+    for (frame, (ground_truth, results)) in evaluated_frames:
+        ((cr, cg, corr, fp, fn), correspondence, border_results) = next(frame_evaluations)
+        if labels_evaluated:
+            stats.append((frame, (cr, cg, len(corr), len(fp), len(fn))))
+            if output_evaluation_details:
+                segmentation_records += [detail.csv_record() for detail in corr + fp + fn]
+            continue
+        # frame could be evaluated on the copies of the cells so border marking is applied here as well
+        for r in border_results:
+            results[r].colour = 1
+        if evaluate_tracking == 1 and not streaming:
+            correspondence_cache.put(frame, ground_truth, results,
+                                     [(ground_truth[g], results[r]) for (g, r) in correspondence])
+        if output_evaluation_details:
+            segmentation_records += [detail.csv_record() for detail in corr + fp + fn]
         stats.append((frame, (cr, cg, len(corr), len(fp), len(fn))))
+        release_masks(itertools.chain(ground_truth, results))
+    if stats == []:
+        exit_no_data()
 
     (crs, cgs, corrs) = (0, 0, 0)
     for (f, (cr, cg, corr, fp, fn)) in stats:
@@ -376,10 +821,10 @@ def run(ground_truth_csv_file,
     results_seg_summary = calculate_metrics_segmentation((crs, cgs, corrs, 0, 0))
     debug_center.show_in_console(None, "Progress", "Done evaluating segmentation...")
 
-    summary_path = algorithm_results_csv_file + "." + filtered_algorithm_name + SUMMARY_SUFFIX
-    tmp_path = algorithm_results_csv_file + "." + filtered_algorithm_name + SEGPLOTDATA_SUFFIX
-    plot_path = algorithm_results_csv_file + "." + filtered_algorithm_name + SEGPLOT_SUFFIX
-    details_path = algorithm_results_csv_file + "." + filtered_algorithm_name + SEGDETAILS_SUFFIX
+    summary_path = output_path_base + SUMMARY_SUFFIX
+    tmp_path = output_path_base + SEGPLOTDATA_SUFFIX
+    plot_path = output_path_base + SEGPLOT_SUFFIX
+    details_path = output_path_base + SEGDETAILS_SUFFIX
 
     debug_center.show_in_console(None, "Progress", "Ploting segmentation results...")
     write_to_file_segmentation([(stat[0], calculate_metrics_segmentation(stat[1])) for stat in stats], tmp_path)
@@ -393,7 +838,7 @@ def run(ground_truth_csv_file,
 
     if output_evaluation_details:
         debug_center.show_in_console(None, "Progress", "Printing detailed segmentation results...")
-        write_to_file_printable(reduce_plus(segmentation_details), details_path)
+        write_records_printable(SegmentationResult.csv_headers(), segmentation_records, details_path)
         debug_center.show_in_console(None, "Progress", "Done printing detailed segmentation results...")
         if draw_evaluation_details:
             if not (input_directory is None or input_file_part is None):
@@ -414,27 +859,44 @@ def run(ground_truth_csv_file,
         debug_center.show_in_console(None, "Info", "Skipping evaluation details printing as desired by parameters.")
 
     if evaluate_tracking == 1:
-        ground_truth_data, list_of_frames, data_per_frame = read_GT(ground_truth_csv_file, True)
+        tracking_frames = load_GT(ground_truth_csv_file, True)
+        # when all the cells are loaded and details are not needed links of all the frames are counted at once
+        tracking_table = None if output_evaluation_details or streaming else TrackingTable()
 
         debug_center.show_in_console(None, "Progress", "Evaluating tracking...")
         stats_tracking = []
-        tracking_details = []
-        data = data_per_frame[list_of_frames[0]]
-        last_data = data
-        last_correspondence = find_correspondence(data[0], data[1])
-        # last_frame_id = list_of_frames[0]
-        # collect all evalustion details
-        for frame in list_of_frames[1:]:
-            data = data_per_frame[frame]
-            new_correspondence = find_correspondence(data[0], data[1])
-
-            (tcr, tcg, tcorr, tfp, tfn) = calculate_stats_tracking(last_data, last_correspondence, data,
-                                                                   new_correspondence)
-            tracking_details += (tcorr, tfp, tfn)
-
-            stats_tracking.append((frame, (len(tcr), len(tcg), len(tcorr))))
-            last_correspondence = new_correspondence
-            last_data = data
+        tracking_records = []
+        list_of_frames = []
+        # only the first (for long-time tracking) and the previous frame are kept
+        first_frame = None
+        last_frame = None
+        for (frame, data) in tracking_frames:
+            if streaming:
+                # results cells close to the border are marked the same way as in segmentation evaluation
+                for cell in filter_border(data[1], image_sizes.get(frame, (100000, 100000))):
+                    cell.colour = 1
+            correspondence = correspondence_cache.get(frame, data[0], data[1])[0]
+            correspondence_cache.evict(frame)
+
+            if tracking_table is not None:
+                tracking_table.add_frame(data, correspondence)
+            elif last_frame is not None:
+                (tcr, tcg, tcorr, tfp, tfn) = calculate_stats_tracking(last_frame[1], last_frame[2], data,
+                                                                       correspondence)
+                if output_evaluation_details:
+                    tracking_records += [detail.csv_record() for detail in tcorr + tfp + tfn]
+                stats_tracking.append((frame, (len(tcr), len(tcg), len(tcorr))))
+
+            release_masks(itertools.chain(data[0], data[1]))
+            list_of_frames.append(frame)
+            if first_frame is None:
+                first_frame = (frame, data, correspondence)
+            last_frame = (frame, data, correspondence)
+        if list_of_frames == []:
+            exit_no_data()
+
+        if tracking_table is not None:
+            stats_tracking = list(zip(list_of_frames, tracking_table.link_counts()))[1:]
 
         (tcrs, tcgs, tcorrs) = (0, 0, 0)
         for (f, (tcr, tcg, tcorr)) in stats_tracking:
@@ -445,9 +907,9 @@ def run(ground_truth_csv_file,
         results_track_summary = calculate_precision_recall_F_metrics(tcrs, tcgs, tcorrs)
         debug_center.show_in_console(None, "Progress", "Done evaluating tracking...")
 
-        tmp_path = algorithm_results_csv_file + "." + filtered_algorithm_name + TRACKPLOTDATA_SUFFIX
-        plot_path = algorithm_results_csv_file + "." + filtered_algorithm_name + TRACKPLOT_SUFFIX
-        details_path = algorithm_results_csv_file + "." + filtered_algorithm_name + TRACKDETAILS_SUFFIX
+        tmp_path = output_path_base + TRACKPLOTDATA_SUFFIX
+        plot_path = output_path_base + TRACKPLOT_SUFFIX
+        details_path = output_path_base + TRACKDETAILS_SUFFIX
 
         debug_center.show_in_console(None, "Progress", "Ploting tracking results...")
         write_to_file_tracking(
@@ -462,7 +924,7 @@ def run(ground_truth_csv_file,
 
         if output_evaluation_details:
             debug_center.show_in_console(None, "Progress", "Printing detailed tracking results...")
-            write_to_file_printable(reduce_plus(tracking_details), details_path)
+            write_records_printable(TrackingResult.csv_headers(), tracking_records, details_path)
             debug_center.show_in_console(None, "Progress", "Done printing detailed tracking results...")
             if draw_evaluation_details:
                 if not (input_directory is None or input_file_part is None):
@@ -483,25 +945,23 @@ def run(ground_truth_csv_file,
                                          "Skipping evaluation details printing as desired by parameters.")
 
         # Calculate additional long-time tracking measure
-        if len(data_per_frame) > 2:
+        if len(list_of_frames) > 2:
             debug_center.show_in_console(None, "Progress", "Evaluating long-time tracking...")
-            long_tracking_details = []
-
-            first_data = data_per_frame[list_of_frames[0]]
-            first_correspondence = find_correspondence(first_data[0], first_data[1])
+            long_tracking_records = []
 
-            last_data = data_per_frame[list_of_frames[-1]]
-            last_correspondence = find_correspondence(last_data[0], last_data[1])
-
-            (lcr, lcg, lcorr, lfp, lfn) = calculate_stats_tracking(first_data, first_correspondence, last_data,
-                                                                   last_correspondence)
-            results_long_track_summary = calculate_precision_recall_F_metrics(len(lcr), len(lcg), len(lcorr))
-            long_tracking_details += (lcorr, lfp, lfn)
+            if tracking_table is None:
+                (lcr, lcg, lcorr, lfp, lfn) = calculate_stats_tracking(first_frame[1], first_frame[2], last_frame[1],
+                                                                       last_frame[2])
+                results_long_track_summary = calculate_precision_recall_F_metrics(len(lcr), len(lcg), len(lcorr))
+                long_tracking_records += [detail.csv_record() for detail in lcorr + lfp + lfn]
+            else:
+                results_long_track_summary = calculate_precision_recall_F_metrics(
+                    *tracking_table.long_time_link_counts())
 
-            details_path = algorithm_results_csv_file + "." + filtered_algorithm_name + LONGTRACKDETAILS_SUFFIX
+            details_path = output_path_base + LONGTRACKDETAILS_SUFFIX
             if output_evaluation_details:
                 debug_center.show_in_console(None, "Progress", "Printing detailed long-time tracking results...")
-                write_to_file_printable(reduce_plus(long_tracking_details), details_path)
+                write_records_printable(TrackingResult.csv_headers(), long_tracking_records, details_path)
                 debug_center.show_in_console(None, "Progress",
                                              "Done printing detailed long-time tracking results...")
                 if draw_evaluation_details:
@@ -529,6 +989,7 @@ def run(ground_truth_csv_file,
             debug_center.show_in_console(None, "Info",
                                          "Skipping long-time tracking evaluation because there are too few frames.")
             results_long_track_summary = []
+        correspondence_cache.retain([])
     else:
         debug_center.show_in_console(None, "Info", "Skipping tracking evaluation as desired by parameters.")
         results_track_summary = []
@@ -0,0 +1,104 @@
+import numpy as np
+
+
+def consecutive_link_counts(keys, frames, frames_count):
+    """
+    Count links between the occurrences of the same key in the consecutive frames.
+    Every pair of such occurrences is a link (the same as in calculate_stats_tracking).
+    Args::
+        keys, frames - arrays with key and frame index of every occurrence
+    Returns::
+        array with the number of links ending in every frame
+    """
+    keys = np.asarray(keys, dtype=np.int64)
+    frames = np.asarray(frames, dtype=np.int64)
+    if len(keys) == 0:
+        return np.zeros(frames_count, dtype=np.int64)
+
+    # unique sorts occurrences by key and then by frame so the links are between the neighbouring rows
+    occurrences, counts = np.unique(keys * frames_count + frames, return_counts=True)
+    occurrence_keys, occurrence_frames = occurrences // frames_count, occurrences % frames_count
+    consecutive = (occurrence_keys[1:] == occurrence_keys[:-1]) & (occurrence_frames[1:] == occurrence_frames[:-1] + 1)
+    links = (counts[1:] * counts[:-1])[consecutive]
+    return np.bincount(occurrence_frames[1:][consecutive], weights=links, minlength=frames_count).astype(np.int64)
+
+
+class TrackingTable(object):
+    """Columnar representation of the whole sequence used to count tracking links of all frames at once.
+
+    For every frame it stores unique ids of the obligatory ground truth cells, of the results cells which are
+    not matched with non-obligatory ground truth and the (ground truth, results) unique id pairs of the
+    correspondence. Unique ids are replaced with consecutive integer codes.
+    """
+
+    def __init__(self):
+        self.frames_count = 0
+        self.unique_ids = {}
+        self.ground_truth = ([], [])  # frame index, unique id code
+        self.results = ([], [])  # frame index, unique id code
+        self.mapping = ([], [], [])  # frame index, ground truth unique id code, results unique id code
+
+    def code(self, unique_id):
+        return self.unique_ids.setdefault(unique_id, len(self.unique_ids))
+
+    def add_frame(self, frame_data, correspondence):
+        """
+        Append next frame of the sequence.
+        Args::
+            frame_data - (ground_truth, results) cells with tracking data
+            correspondence - [(ground_truth_cell, results_cell)] of the frame
+        """
+        (ground_truth, results) = frame_data
+        frame_index = self.frames_count
+        self.frames_count += 1
+
+        matched_gt = {}
+        for (gt, res) in correspondence:
+            matched_gt.setdefault(res, gt)
+
+        for cell in ground_truth:
+            if cell.obligatory():
+                self.ground_truth[0].append(frame_index)
+                self.ground_truth[1].append(self.code(cell.unique_id))
+        for cell in results:
+            if cell not in matched_gt or matched_gt[cell].obligatory():
+                self.results[0].append(frame_index)
+                self.results[1].append(self.code(cell.unique_id))
+        for (gt, res) in correspondence:
+            if gt.obligatory():
+                self.mapping[0].append(frame_index)
+                self.mapping[1].append(self.code(gt.unique_id))
+                self.mapping[2].append(self.code(res.unique_id))
+
+    def _link_counts(self, frame_positions, positions_count):
+        """Count links between the consecutive positions assigned to frames (-1 for the ignored frames)."""
+        frame_positions = np.asarray(frame_positions, dtype=np.int64)
+
+        def count(frames, keys):
+            positions = frame_positions[np.asarray(frames, dtype=np.int64)]
+            kept = positions != -1
+            return consecutive_link_counts(np.asarray(keys, dtype=np.int64)[kept], positions[kept], positions_count)
+
+        mapping_keys = np.asarray(self.mapping[1], dtype=np.int64) * len(self.unique_ids) + np.asarray(
+            self.mapping[2], dtype=np.int64)
+        found = count(*self.results)
+        real = count(*self.ground_truth)
+        correct = count(self.mapping[0], mapping_keys)
+        return [(int(f), int(r), int(c)) for (f, r, c) in zip(found, real, correct)]
+
+    def link_counts(self):
+        """
+        Returns::
+            [(found_links, real_links, correct_links)] between every frame and the previous one (zeros for the first frame)
+        """
+        return self._link_counts(np.arange(self.frames_count), self.frames_count)
+
+    def long_time_link_counts(self):
+        """
+        Returns::
+            (found_links, real_links, correct_links) between the first and the last frame
+        """
+        frame_positions = np.full(self.frames_count, -1, dtype=np.int64)
+        frame_positions[0] = 0
+        frame_positions[-1] = 1
+        return self._link_counts(frame_positions, 2)[1]
@@ -1,10 +1,16 @@
+import bz2
 import csv
+import gzip
+import io
 import os
 import re
 import shlex
 import stat
 import sys
+import zipfile
+from collections import deque
 from functools import reduce
+from multiprocessing.pool import ThreadPool
 
 import numpy as np
 
@@ -13,6 +19,11 @@ try:
 except:
     import ConfigParser
 
+try:
+    import lzma
+except ImportError:
+    lzma = None
+
 from ep.evalplatform import debug
 
 CONFIG_FILENAME = "evaluation.ini"
@@ -37,6 +48,14 @@ TRACK_DRAWING_FOLDER = "Tracking details"
 LONG_DRAWING_FOLDER = "Long tracking details"
 ALL_DIRECTORIES = [SEG_DRAWING_FOLDER, TRACK_DRAWING_FOLDER, LONG_DRAWING_FOLDER]
 
+# Compressed and archived input
+COMPRESSION_SUFFIXES = [".gz", ".bz2", ".xz"]
+ARCHIVE_SUFFIX = ".zip"
+
+# inputs created in memory (e.g. per-frame files merged by evaluate.py): normalized path -> unicode text,
+# whoever stores the input removes it with discard_memory_input when it is no longer read
+memory_inputs = {}
+
 
 def reduce_plus(ls):
     return reduce(lambda a, b: a + b, ls)
@@ -125,6 +144,135 @@ def ensure_directory_in(filepath, directory_name):
     return ensured_directory_path
 
 
+def split_archive_path(path):
+    """
+    Files in zip archives are given as path/to/archive.zip/member.
+    Returns::
+        (archive_path, member) or (path, None) if the path does not point to a file in an archive
+    """
+    match = re.match(r"^(.*?" + re.escape(ARCHIVE_SUFFIX) + r")[\\/](.+)$", path, re.IGNORECASE)
+    if match is not None and os.path.isfile(match.group(1)):
+        return match.group(1), match.group(2).replace("\\", "/")
+    return path, None
+
+
+def list_archive(archive_path):
+    """
+    Returns::
+        [member] names of the files in the zip archive
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        return [name for name in archive.namelist() if not name.endswith("/")]
+
+
+def strip_compression_suffix(path):
+    (root, extension) = os.path.splitext(path)
+    if extension.lower() in COMPRESSION_SUFFIXES:
+        return root
+    return path
+
+
+def flat_input_path(path):
+    """
+    Returns::
+        path next to the archive that can be used instead of the path of a file in the archive (e.g. as the base
+        of the output paths), other paths are returned unchanged
+    """
+    (archive_path, member) = split_archive_path(path)
+    if member is None:
+        return path
+    return archive_path + "." + member.replace("/", ".")
+
+
+def store_memory_input(path, lines):
+    """Keep the input data in memory, it is read by open_input as the file of the given path."""
+    lines = list(lines)
+    if lines and isinstance(lines[0], bytes):
+        text = b"".join(lines).decode("utf-8")  # str lines of python 2
+    else:
+        text = u"".join(lines)
+    memory_inputs[os.path.normpath(path)] = text
+
+
+def discard_memory_input(path):
+    """Free the input stored in memory under the path (if there is one)."""
+    memory_inputs.pop(os.path.normpath(path), None)
+
+
+def get_memory_input(path):
+    """
+    Returns::
+        text of the input stored in memory under the path or None if there is none
+    """
+    return memory_inputs.get(os.path.normpath(path))
+
+
+def open_input(path, mode="r"):
+    """
+    Open the input file for reading. Files compressed with gzip, bz2 or xz and files in zip archives are
+    decompressed while they are read so nothing is extracted to disk. Inputs stored with store_memory_input are
+    read from memory.
+    Args::
+        mode - "r" for text (with universal newlines) or "rb" for bytes
+    Returns::
+        file object
+    """
+    text = get_memory_input(path)
+    if text is not None:
+        return io.StringIO(text) if mode == "r" else io.BytesIO(text.encode("utf-8"))
+
+    (archive_path, member) = split_archive_path(path)
+    if member is not None:
+        with zipfile.ZipFile(archive_path) as archive:
+            stream = archive.open(member)  # member stays readable after the archive is closed
+        extension = os.path.splitext(member)[1].lower()
+    else:
+        stream = None
+        extension = os.path.splitext(path)[1].lower()
+
+    if extension == ".gz":
+        stream = gzip.GzipFile(path if stream is None else None, "rb", fileobj=stream)
+    elif extension == ".bz2":
+        stream = bz2.BZ2File(path if stream is None else stream, "rb")
+    elif extension == ".xz":
+        if lzma is None:
+            raise Exception("Reading xz compressed files requires lzma module: " + path)
+        stream = lzma.LZMAFile(path if stream is None else stream, "rb")
+
+    if stream is None:
+        return io.open(path, mode)
+    if mode == "r":
+        return io.TextIOWrapper(stream, newline=None)
+    return stream
+
+
+def ordered_map(function, items, threads=1, ahead=None):
+    """
+    Lazy map which calls the function for the items in a pool of threads (e.g. to read many files at once).
+    At most ahead (2 * threads by default) results are computed before they are consumed.
+    Returns::
+        generator of the results in the order of the items
+    """
+    if threads <= 1:
+        for item in items:
+            yield function(item)
+        return
+
+    ahead = ahead or 2 * threads
+    pool = ThreadPool(threads)
+    try:
+        pending = deque()
+        for item in items:
+            if len(pending) >= ahead:
+                yield pending.popleft().get()
+            pending.append(pool.apply_async(function, (item,)))
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
 def determine_output_filepath(filepath, output_path):
     if os.path.isabs(filepath):
         if os.path.isabs(output_path):
@@ -1,10 +1,96 @@
 import numpy as np
-from cached_property import cached_property
 
 from .utils import slices_intersection, slices_relative, parse_file_order
 
+BITS_IN_BYTE = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def count_bits(bits):
+    """
+    Returns::
+        number of bits set in the uint8 array
+    """
+    if hasattr(np, "bitwise_count"):
+        return int(np.bitwise_count(bits).sum())
+    return int(BITS_IN_BYTE[bits].sum())
+
+
+class PackedMask(object):
+    """Cell mask with 8 pixels in a byte instead of bool array.
+
+    Rows are packed starting from the image column which is a multiple of 8 (bits before the mask are not set)
+    so the bytes of different masks are aligned and their intersection is counted directly on the packed rows.
+    """
+    __slots__ = ("bits", "y_start", "x_start", "width")
+
+    def __init__(self, bits, y_start, x_start, width):
+        self.bits = bits
+        self.y_start = y_start
+        self.x_start = x_start
+        self.width = width
+
+    @staticmethod
+    def pack(mask, mask_slice):
+        """
+        Args::
+            mask - bool array of the cell placed at mask_slice of the image
+        """
+        (y_start, x_start) = (mask_slice[0].start or 0, mask_slice[1].start or 0)
+        offset = x_start % 8
+        if offset:
+            aligned = np.zeros((mask.shape[0], offset + mask.shape[1]), dtype=bool)
+            aligned[:, offset:] = mask
+        else:
+            aligned = mask
+        return PackedMask(np.packbits(aligned, axis=1), y_start, x_start, mask.shape[1])
+
+    @property
+    def shape(self):
+        return self.bits.shape[0], self.width
+
+    def unpack(self):
+        """
+        Returns::
+            bool array of the mask
+        """
+        offset = self.x_start % 8
+        # bits after the mask (up to the byte end) are cut off with the slice (count argument needs numpy 1.17)
+        return np.unpackbits(self.bits, axis=1)[:, offset:offset + self.width].view(bool)
+
+    def area(self):
+        return count_bits(self.bits)
+
+    def intersection(self, other):
+        """
+        Returns::
+            number of pixels in both masks
+        """
+        y_start = max(self.y_start, other.y_start)
+        y_stop = min(self.y_start + self.bits.shape[0], other.y_start + other.bits.shape[0])
+        (self_byte, other_byte) = (self.x_start // 8, other.x_start // 8)
+        byte_start = max(self_byte, other_byte)
+        byte_stop = min(self_byte + self.bits.shape[1], other_byte + other.bits.shape[1])
+        if y_start >= y_stop or byte_start >= byte_stop:
+            return 0
+        self_bits = self.bits[y_start - self.y_start:y_stop - self.y_start, byte_start - self_byte:byte_stop - self_byte]
+        other_bits = other.bits[y_start - other.y_start:y_stop - other.y_start,
+                                byte_start - other_byte:byte_stop - other_byte]
+        return count_bits(self_bits & other_bits)
+
+
+def unpack_mask(mask):
+    """
+    Returns::
+        bool array of the mask stored as bool array or PackedMask (None if there is no mask)
+    """
+    return mask.unpack() if isinstance(mask, PackedMask) else mask
+
+
+class CellOccurence(object):
+    # area and hash are calculated once, hash is recalculated if colour changes
+    __slots__ = ("frame_number", "cell_id", "unique_id", "position", "_colour", "_mask", "mask_slice", "mask_source",
+                 "_area", "_hash")
 
-class CellOccurence:
     def __init__(self, frame_number, cell_id, unique_id, position, colour=0):
         """
         All parameters should be greater that zero.
@@ -18,8 +104,19 @@ class CellOccurence:
         self.position = position
         self.colour = colour
 
-        self.mask = None
+        self._mask = None
         self.mask_slice = None
+        self.mask_source = None  # if set, mask is read from it when needed (e.g. FrameMasks)
+        self._area = None
+
+    @property
+    def colour(self):
+        return self._colour
+
+    @colour.setter
+    def colour(self, colour):
+        self._colour = colour
+        self._hash = None
 
     def get_id(self):
         """Return id of the cell in its frame."""
@@ -35,8 +132,38 @@ class CellOccurence:
     def has_tracking_data(self):
         return self.unique_id != -1
 
+    @property
+    def mask(self):
+        """Bool array of the cell pixels in mask_slice (or None)."""
+        return unpack_mask(self.stored_mask())
+
+    @mask.setter
+    def mask(self, mask):
+        """Mask can be set as bool array or PackedMask."""
+        self._mask = mask
+
+    def stored_mask(self):
+        """
+        Returns::
+            mask the way it is kept by the cell: bool array, PackedMask or None
+        """
+        if self._mask is None and self.mask_source is not None:
+            self._mask = self.mask_source.cell_mask(self)
+        return self._mask
+
+    def release_mask(self):
+        """
+        Drop the mask if it can be read again from mask_source.
+        Returns::
+            if the cell has mask_source
+        """
+        if self.mask_source is None:
+            return False
+        self._mask = None
+        return True
+
     def has_contour_data(self):
-        return self.mask is not None
+        return self._mask is not None or self.mask_source is not None
 
     def obligatory(self):
         return self.colour == 0
@@ -44,19 +171,23 @@ class CellOccurence:
     def distance(self, cell_b):
         return ((self.position[0] - cell_b.position[0]) ** 2 + (self.position[1] - cell_b.position[1]) ** 2) ** 0.5
 
-    @cached_property
+    @property
     def area(self):
-        if self.has_contour_data():
-            return np.count_nonzero(self.mask)
-        return None
+        if self._area is None and self.has_contour_data():
+            mask = self.stored_mask()
+            self._area = mask.area() if isinstance(mask, PackedMask) else np.count_nonzero(mask)
+        return self._area
 
     def overlap(self, cell_b):
         if self.has_contour_data() and cell_b.has_contour_data():
+            (mask, mask_b) = (self.stored_mask(), cell_b.stored_mask())
+            if isinstance(mask, PackedMask) and isinstance(mask_b, PackedMask):
+                return mask.intersection(mask_b)
             slices_overlap = slices_intersection(self.mask_slice, cell_b.mask_slice)
             if slices_overlap is not None:
                 slice_relative_1 = slices_relative(self.mask_slice, slices_overlap)
                 slice_relative_2 = slices_relative(cell_b.mask_slice, slices_overlap)
-                overlap = self.mask[slice_relative_1] & cell_b.mask[slice_relative_2]
+                overlap = unpack_mask(mask)[slice_relative_1] & unpack_mask(mask_b)[slice_relative_2]
                 return np.count_nonzero(overlap)
             else:
                 return 0
@@ -76,24 +207,270 @@ class CellOccurence:
             return -self.distance(cell_b)
 
     def is_similar(self, cell_b, position_cutoff, iou_cutoff):
+        return self.similarity_if_similar(cell_b, position_cutoff, iou_cutoff) is not None
+
+    def similarity_if_similar(self, cell_b, position_cutoff, iou_cutoff):
+        """Return similarity to cell_b or None if cells are not similar (iou or distance is calculated only once)."""
         iou_with_b = self.iou(cell_b)
         if iou_with_b is not None:
-            return iou_with_b > iou_cutoff
+            return iou_with_b if iou_with_b > iou_cutoff else None
         else:
-            return self.distance(cell_b) < position_cutoff
+            distance = self.distance(cell_b)
+            return -distance if distance < position_cutoff else None
 
-    def __hash__(self):
+    def calculate_hash(self):
         return hash(self.frame_number) ^ hash(self.get_id()) ^ hash(self.position) ^ hash(self.colour)
 
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = self.calculate_hash()
+        return self._hash
+
     def __eq__(self, other):
         return self.frame_number == other.frame_number and self.get_id() == other.get_id() and self.position == other.position and self.colour == other.colour
 
+    def __ne__(self, other):
+        return not self == other
+
     def __str__(self):
         return "frame={0},id={1},position={2},color={3}".format(self.frame_number, self.get_id(), self.position,
                                                                 self.colour)
 
 
+class CellView(CellOccurence):
+    """Lightweight stand-in for CellOccurence which reads (and writes) its attributes from a row of CellTable."""
+    __slots__ = ("table", "row")
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+        # the rest of CellOccurence attributes is not kept in the table
+        self._mask = None
+        self.mask_source = None
+        self._area = None
+        self._hash = None
+
+    @property
+    def frame_number(self):
+        return self.table.frame_number.item(self.row)
+
+    @property
+    def cell_id(self):
+        return self.table.cell_id.item(self.row)
+
+    @property
+    def unique_id(self):
+        return self.table.unique_id.item(self.row)
+
+    @property
+    def position(self):
+        return self.table.position_x.item(self.row), self.table.position_y.item(self.row)
+
+    @property
+    def colour(self):
+        return self.table.colour.item(self.row)
+
+    @colour.setter
+    def colour(self, colour):
+        self.table.colour[self.row] = colour
+
+    @property
+    def mask(self):
+        return unpack_mask(self.stored_mask())
+
+    @mask.setter
+    def mask(self, mask):
+        self.table.mask_columns()[0][self.row] = mask
+
+    def stored_mask(self):
+        return None if self.table.mask is None else self.table.mask[self.row]
+
+    @property
+    def mask_slice(self):
+        return None if self.table.mask_slice is None else self.table.mask_slice[self.row]
+
+    @mask_slice.setter
+    def mask_slice(self, mask_slice):
+        self.table.mask_columns()[1][self.row] = mask_slice
+
+    @property
+    def area(self):
+        mask = self.stored_mask()
+        if isinstance(mask, PackedMask):
+            return mask.area()
+        if mask is not None:
+            return np.count_nonzero(mask)
+        return None
+
+    def release_mask(self):
+        return False
+
+    def has_contour_data(self):
+        return self.stored_mask() is not None
+
+    def __hash__(self):
+        # not cached as the colour can be changed by the other views of the same row
+        return self.calculate_hash()
+
+    def __reduce__(self):
+        # copied (e.g. sent to the worker processes) as a standalone cell, not with the whole table
+        return CellOccurence, (self.frame_number, self.cell_id, self.unique_id, self.position, self.colour), \
+            (None, {"mask": self.stored_mask(), "mask_slice": self.mask_slice})
+
+
+class CellTable(object):
+    """Cells stored in NumPy arrays (a column for every attribute) instead of separate CellOccurence objects.
+
+    Behaves as the list of (frame_number, Cell) returned by the parsers where the cells are CellView objects
+    created only when they are accessed. Table returned by select shares the columns with the original one
+    so changes made through the cells (e.g. colour) are visible in both of them.
+    """
+
+    def __init__(self, frame_number, cell_id, unique_id, position_x, position_y, colour, mask=None,
+                 mask_slice=None):
+        frame_number = np.asarray(frame_number)
+        if frame_number.dtype.kind not in "iu":
+            # frames named with strings are kept as python objects
+            frame_number = np.asarray(frame_number, dtype=object)
+        self.frame_number = frame_number
+        self.cell_id = np.asarray(cell_id, dtype=np.int64)
+        self.unique_id = np.asarray(unique_id, dtype=np.int64)
+        self.position_x = np.asarray(position_x, dtype=np.float64)
+        self.position_y = np.asarray(position_y, dtype=np.float64)
+        self.colour = np.asarray(colour, dtype=np.int64)
+        self.mask = mask
+        self.mask_slice = mask_slice
+        self.rows = None  # rows of the columns used by the table (all if None)
+
+    @staticmethod
+    def from_cells(cells):
+        """
+        Args::
+            cells - [Cell]
+        Returns::
+            CellTable with the data (including masks) of the given cells
+        """
+        def object_column(values):
+            # filled one by one so that tuples and arrays are not broadcast
+            column = np.empty(len(values), dtype=object)
+            for (i, value) in enumerate(values):
+                column[i] = value
+            return column
+
+        masks = [c.stored_mask() for c in cells]
+        has_masks = any([m is not None for m in masks])
+        return CellTable(CellTable.frame_column([c.frame_number for c in cells]), [c.cell_id for c in cells],
+                         [c.unique_id for c in cells], [c.position[0] for c in cells], [c.position[1] for c in cells],
+                         [c.colour for c in cells],
+                         object_column(masks) if has_masks else None,
+                         object_column([c.mask_slice for c in cells]) if has_masks else None)
+
+    @staticmethod
+    def frame_column(frame_number):
+        """
+        Args::
+            frame_number - [int or string] frames of the rows
+        Returns::
+            int64 column if all the frames are numbers, otherwise column of python objects
+        """
+        if all([isinstance(f, int) for f in frame_number]):
+            return np.array(frame_number, dtype=np.int64)
+        column = np.empty(len(frame_number), dtype=object)
+        column[:] = frame_number
+        return column
+
+    def row_indices(self):
+        return np.arange(len(self.frame_number)) if self.rows is None else self.rows
+
+    def mask_columns(self):
+        """
+        Returns::
+            (mask, mask_slice) columns, created empty if the table has no masks yet
+        """
+        if self.mask is None:
+            (self.mask, self.mask_slice) = (np.empty(len(self.frame_number), dtype=object),
+                                            np.empty(len(self.frame_number), dtype=object))
+        return self.mask, self.mask_slice
+
+    def select(self, rows):
+        """
+        Args::
+            rows - indices or boolean mask of the table rows
+        Returns::
+            CellTable with the selected rows sharing the columns with this one
+        """
+        selected = CellTable.__new__(CellTable)
+        selected.__dict__.update(self.__dict__)
+        selected.rows = self.row_indices()[rows]
+        return selected
+
+    def group_by_frame(self):
+        """
+        Returns::
+            {frame: CellTable} with the rows in the table order
+        """
+        rows = self.row_indices()
+        frames = self.frame_number[rows]
+        if frames.dtype == object:
+            frame_rows = {}
+            for (i, frame) in enumerate(frames):
+                frame_rows.setdefault(frame, []).append(i)
+            return dict([(frame, self.select(np.array(indices))) for (frame, indices) in frame_rows.items()])
+
+        order = np.argsort(frames, kind="stable")
+        (unique_frames, starts) = np.unique(frames[order], return_index=True)
+        return dict([(int(frame), self.select(indices))
+                     for (frame, indices) in zip(unique_frames, np.split(order, starts[1:]))])
+
+    def positions(self):
+        """
+        Returns::
+            array of (x, y) rows
+        """
+        rows = self.row_indices()
+        return np.column_stack([self.position_x[rows], self.position_y[rows]])
+
+    def obligatory(self):
+        """
+        Returns::
+            boolean array which rows are obligatory cells
+        """
+        return self.colour[self.row_indices()] == 0
+
+    def has_tracking_data(self):
+        """
+        Returns::
+            boolean array which rows have tracking data
+        """
+        return self.unique_id[self.row_indices()] != -1
+
+    def set_colour(self, colour):
+        self.colour[self.row_indices()] = colour
+
+    def __len__(self):
+        return len(self.frame_number) if self.rows is None else len(self.rows)
+
+    def cells(self):
+        """
+        Returns::
+            [CellView] of all the rows
+        """
+        return [CellView(self, row) for row in self.row_indices().tolist()]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [(cell.frame_number, cell) for cell in self.select(index).cells()]
+        cell = CellView(self, int(self.row_indices()[index]))
+        return cell.frame_number, cell
+
+    def __iter__(self):
+        for cell in self.cells():
+            yield cell.frame_number, cell
+
+
 class TrackingLink(object):
+    __slots__ = ("cell_A", "cell_B")
+
     def __init__(self, cell_A, cell_B):
         self.cell_A = cell_A
         self.cell_B = cell_B
@@ -104,6 +481,9 @@ class TrackingLink(object):
     def __eq__(self, other):
         return self.cell_A == other.cell_A and self.cell_B == other.cell_B
 
+    def __ne__(self, other):
+        return not self == other
+
     def __str__(self):
         return "({0}-{1})".format(self.cell_A, self.cell_B)
 
@@ -125,6 +505,7 @@ class EvaluationDetail(object):
         frame - when the evaluation occurs
         result - overall result description
     """
+    __slots__ = ("frame", "result")
 
     def __init__(self, frame, result):
         self.result = result
@@ -163,9 +544,11 @@ class SegmentationResult(EvaluationDetail):
     Attributes:
         cell_GT - cell from ground truth
         cell_algo - cell found by an algorithm
+        iou - iou of the cells (if already known it can be provided, otherwise it is calculated)
     """
+    __slots__ = ("cell_GT", "cell_algo", "iou")
 
-    def __init__(self, cell_gt=None, cell_algo=None):
+    def __init__(self, cell_gt=None, cell_algo=None, iou=None):
         self.iou = None
         if not (cell_gt is None and cell_algo is None):
             EvaluationDetail.__init__(self, (cell_gt or cell_algo).frame_number,
@@ -174,7 +557,7 @@ class SegmentationResult(EvaluationDetail):
             self.cell_algo = cell_algo
 
             if cell_gt is not None and cell_algo is not None:
-                self.iou = self.cell_GT.iou(self.cell_algo)
+                self.iou = iou if iou is not None else self.cell_GT.iou(self.cell_algo)
         else:
             self.cell_GT = None
             self.cell_algo = None
@@ -233,6 +616,7 @@ class TrackingResult(EvaluationDetail):
         link_GT - link from ground truth
         link_algo - link found by an algorithm
     """
+    __slots__ = ("prev_frame", "link_GT", "link_algo")
 
     def __init__(self, link_gt=None, link_algo=None):
         if not (link_gt is None and link_algo is None):
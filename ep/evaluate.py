@@ -1,5 +1,10 @@
 #!/usr/bin/env python2
+import heapq
+import itertools
+import operator
 import shutil
+import tempfile
+from collections import deque
 
 import ep.evalplatform.plot_comparison as evaluate
 from ep.evalplatform.parsers_image import ImageCellParser
@@ -10,16 +15,28 @@ TMP_SUFFIX = ".tmp"  # every added intermediate file has tmp suffix in the name,
 DEFAULT_PARSER = "PLATFORM_DEF"
 OUTPUT_FOLDER = "Output"
 MERGED_SUFFIXES = [".tmp", ".merged", ".merged2"]  # reeeallly?
+SORT_CHUNK_ROWS = 1000000  # rows of unsorted seg / track file sorted in memory at once
 
 delete_tmp = 0  # are all temporary files to be removed at the end of the evaluation? Value is read from ini file.
+loading_threads = 1  # number of per-frame files read at once. Value is read from ini file.
 
 
 def find_all_files(folder, filename):
-    files = [f for f in os.listdir(folder) if
-             os.path.isfile(os.path.join(folder, f)) and filename in f and (TMP_SUFFIX not in f) and (
-                     ".track_eval" not in f and ".seg_eval" not in f and ".eval." not in f and ".eval_summary." not in f)
-             and f != filename + ".merged"
-             ]
+    """
+    Files in zip archives are searched as well (matched by their path inside the archive) and returned as
+    archive.zip/member.
+    """
+
+    def is_input(f):
+        return filename in f and (TMP_SUFFIX not in f) and (
+                ".track_eval" not in f and ".seg_eval" not in f and ".eval." not in f and ".eval_summary." not in f) \
+               and f != filename + ".merged"
+
+    names = [f for f in os.listdir(folder) if os.path.isfile(os.path.join(folder, f))]
+    files = [f for f in names if not f.lower().endswith(ARCHIVE_SUFFIX) and is_input(f)]
+    for archive in [f for f in names if f.lower().endswith(ARCHIVE_SUFFIX)]:
+        files += [archive + "/" + member for member in list_archive(os.path.join(folder, archive))
+                  if is_input(member)]
     return files
 
 
@@ -39,81 +56,192 @@ def get_trailing_number(text):
     return parse_file_order(get_trailing_order(text, is_path=False))
 
 
+def get_file_number(file_name):
+    return get_trailing_number(os.path.splitext(strip_compression_suffix(file_name))[0])
+
+
 def determine_all_snaptimes(file_names):
     """Return list of times."""
-    return [get_trailing_number(os.path.splitext(file)[0]) for file in file_names]
-
-
-def merge_seg_track_files(folder, files):
-    """Merge two files into one, add tmp suffix if not already there."""
-    file_one = open(os.path.join(folder, files[0]), "rU")
-    seg_all = file_one.readlines()
-    seg_header, seg = seg_all[0], seg_all[1:]
-    file_one.close()
-
-    file_two = open(os.path.join(folder, files[1]), "rU")
-    tracking_all = file_two.readlines()
-    tracking_header, tracking = tracking_all[0], tracking_all[1:]
-    file_two.close()
-
-    segment = dict([((int(line.split(",")[0]), int(line.split(",")[1])), line.split(",")[2:]) for line in seg])
-    track = dict([((int(line.split(",")[0]), int(line.split(",")[1])), line.split(",")[2:]) for line in tracking])
-    new_header = ",".join([seg_header] + tracking_header.split(",")[2:]).replace("\n", "")
-    for key in segment.keys():
-        if key in track:
-            segment[key] += track[key]
-        else:
-            segment[key] += ['-1']
+    return [get_file_number(file) for file in file_names]
 
-    lines = [",".join(list([str(k) for k in key]) + value) for (key, value) in sorted(segment.items())]
-    lines = [new_header + "\n"] + ([line.replace("\n", "") + "\n" for line in lines])
 
-    output_name = files[0] + ".merged2"
+def merged_file_name(folder, file_name, suffix):
+    """Name of the input merged from the given input file, add tmp suffix if not already there."""
+    output_name = os.path.basename(flat_input_path(os.path.join(folder, file_name))) + suffix
     if TMP_SUFFIX not in output_name:
         output_name += TMP_SUFFIX
+    return output_name
+
 
-    output_file = open(os.path.join(folder, output_name), "w")
-    output_file.writelines(lines)
-    output_file.close()
+class UnsortedRowsError(Exception):
+    pass
+
+
+def keyed_rows(lines):
+    """
+    Split only the key from the lines of seg / track file.
+    Returns::
+        generator of ((frame, cell), [rest of the line]) where the rest is omitted if the line has only the key
+    """
+    for line in lines:
+        fields = line.rstrip("\n").split(",", 2)
+        yield (int(fields[0]), int(fields[1])), fields[2:]
+
+
+def checked_sorted_rows(rows):
+    """
+    Pass the rows through checking that they are sorted by the key.
+    Raises::
+        UnsortedRowsError on the first row with smaller key than the previous one
+    """
+    previous_key = None
+    for (key, rest) in rows:
+        if previous_key is not None and key < previous_key:
+            raise UnsortedRowsError()
+        previous_key = key
+        yield key, rest
+
+
+def externally_sorted_rows(rows, chunk_rows=None):
+    """
+    Sort the rows by the key (stable) holding at most chunk_rows of them in memory. Sorted chunks are written to
+    temporary files and merged.
+    Returns::
+        generator of the rows sorted by the key
+    """
+    chunk_rows = chunk_rows or SORT_CHUNK_ROWS
+    runs = []
+    try:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_rows))
+            chunk.sort(key=operator.itemgetter(0))
+            if not runs and len(chunk) < chunk_rows:
+                # everything fits in one chunk
+                for row in chunk:
+                    yield row
+                return
+            if not chunk:
+                break
+            run = tempfile.TemporaryFile("w+")
+            runs.append(run)
+            run.writelines([",".join([str(key[0]), str(key[1])] + rest) + "\n" for (key, rest) in chunk])
+            run.seek(0)
+
+        # rows with equal keys are taken from the earlier runs first, the key is followed by the run and row number
+        # so the rest of the rows is never compared
+        def run_rows(run_number, run):
+            for (row_number, (key, rest)) in enumerate(keyed_rows(run)):
+                yield key, run_number, row_number, rest
+
+        for (key, _, _, rest) in heapq.merge(*[run_rows(n, run) for (n, run) in enumerate(runs)]):
+            yield key, rest
+    finally:
+        for run in runs:
+            run.close()
+
+
+def last_of_keys(rows):
+    """
+    Returns::
+        generator of the sorted rows with only the last row of the rows with the same key
+    """
+    previous = None
+    for row in rows:
+        if previous is not None and row[0] != previous[0]:
+            yield previous
+        previous = row
+    if previous is not None:
+        yield previous
+
+
+def join_seg_track_rows(seg_rows, track_rows):
+    """
+    Merge-join the rows sorted by the key. Every seg row is extended with the track data (or -1 if there is
+    no track row with the same key), track rows without seg row are omitted.
+    Returns::
+        generator of the joined lines
+    """
+    track_rows = last_of_keys(track_rows)
+    track = next(track_rows, None)
+    for (key, seg_rest) in last_of_keys(seg_rows):
+        while track is not None and track[0] < key:
+            track = next(track_rows, None)
+        track_rest = track[1] if track is not None and track[0] == key else ['-1']
+        yield ",".join([str(key[0]), str(key[1])] + seg_rest + track_rest) + "\n"
+
+
+def merge_seg_track_files(folder, files, chunk_rows=None):
+    """
+    Merge two files into one created in the folder, the joined rows are written as they are produced.
+    Files are joined by (frame, cell) in one pass if they are already sorted by it (which is the case for the files
+    merged with merge_files_into_one), otherwise they are sorted first in chunks of chunk_rows.
+    Returns::
+        name of the merged file
+    """
+    seg_path = os.path.join(folder, files[0])
+    track_path = os.path.join(folder, files[1])
+    output_name = merged_file_name(folder, files[0], ".merged2")
+
+    def join(sort):
+        with open_input(seg_path) as seg_file, open_input(track_path) as track_file, \
+                open(os.path.join(folder, output_name), "w") as output_file:
+            seg_header = seg_file.readline()
+            tracking_header = track_file.readline()
+            new_header = ",".join([seg_header] + tracking_header.split(",")[2:]).replace("\n", "")
+            output_file.write(new_header + "\n")
+            track_rows = sort(keyed_rows(track_file))
+            output_file.writelines(join_seg_track_rows(sort(keyed_rows(seg_file)), track_rows))
+            deque(track_rows, maxlen=0)  # the rest of track rows is not joined but has to be checked as well
+
+    try:
+        join(checked_sorted_rows)
+    except UnsortedRowsError:
+        debug_center.show_in_console(None, "Tech", "".join(["Sorting unsorted ", files[0], " and ", files[1]]))
+        join(lambda rows: externally_sorted_rows(rows, chunk_rows))
+    # inputs merged in memory are not needed any more
+    discard_memory_input(seg_path)
+    discard_memory_input(track_path)
     return output_name
 
 
-def merge_files_into_one(times, folder, files):
-    """Merge many files into one, add tmp suffix if not already there."""
+def merge_files_into_one(times, folder, files, threads=1):
+    """
+    Merge many files into one kept in memory (it is read with open_input as a file in the folder).
+    Every line of the files is tagged with the frame number taken from the file name.
+    Args::
+        threads - number of files read at once
+    Returns::
+        name of the merged input
+    """
 
-    def add_file(write_file, new_file_path, time):
+    def file_lines(time_file):
+        (time, new_file_path) = time_file
         if ImageCellParser.is_image(new_file_path):
             data = [new_file_path]
         else:
-            new_file = open(new_file_path, "rU")
-            data = new_file.readlines()[1:]
-            new_file.close()
+            with open_input(new_file_path) as new_file:
+                data = new_file.readlines()[1:]
 
-        with_frame_number = [",".join([str(time)] + [line.strip() + "\n"]) for line in data]
-        write_file.writelines(with_frame_number)
+        return [",".join([str(time)] + [line.strip() + "\n"]) for line in data]
 
-    number_files = sorted([(get_trailing_number(os.path.splitext(x)[0]), x) for x in files])
+    number_files = sorted([(get_file_number(x), x) for x in files])
 
-    output_name = files[0] + ".merged"
-    if TMP_SUFFIX not in output_name:
-        output_name += TMP_SUFFIX
+    output_name = merged_file_name(folder, files[0], ".merged")
 
     # Read header
     first_file_path = os.path.join(folder, files[0])
     if ImageCellParser.is_image(first_file_path):
         header = "Filepath\n"
     else:
-        first_file = open(first_file_path, "rU")
-        header = first_file.readlines()[0]
-        first_file.close()
+        with open_input(first_file_path) as first_file:
+            header = first_file.readline()
 
-    write_file = open(os.path.join(folder, output_name), "w")
-    write_file.writelines("Frame_number, " + header)
-    for num, file in number_files:
-        if num in times:
-            add_file(write_file, os.path.join(folder, file), num)
+    lines = ["Frame_number, " + header]
+    for data in ordered_map(file_lines, [(num, os.path.join(folder, file)) for (num, file) in number_files
+                                         if num in times], threads):
+        lines += data
 
-    write_file.close()
+    store_memory_input(os.path.join(folder, output_name), lines)
     return output_name
 
 
@@ -170,6 +298,15 @@ if __name__ == '__main__':
         automatic_details_drawing_params = ['/Input', os.path.join(testset_folder, arg_list[1]), arg_list[2]]
         arg_list = arg_list[3:]
 
+    workers = 1
+    if arg_list != [] and arg_list[0] == '/Workers':
+        workers = int(arg_list[1])
+        arg_list = arg_list[2:]
+
+    streaming = arg_list != [] and arg_list[0] == '/Streaming'
+    if streaming:
+        arg_list = arg_list[1:]
+
     # Validate multifile
     if many_files_gt ^ many_files_algo:
         debug_center.show_in_console(None, "Warning",
@@ -202,17 +339,23 @@ if __name__ == '__main__':
                 times += determine_all_snaptimes(find_all_files(algo[0], algo[2]))
 
         all_times = list(set(times))
+        if read_ini(CONFIG_FILE, 'input', 'threads') != '':
+            loading_threads = int(read_ini(CONFIG_FILE, 'input', 'threads'))
         # Merge files for every group
 
         if many_files_gt:
-            gt_files = [merge_files_into_one(all_times, gt[0], find_all_files(gt[0], gt[1]))]
+            gt_files = [merge_files_into_one(all_times, gt[0], find_all_files(gt[0], gt[1]),
+                                             loading_threads)]
             if len(gt) > 2:
-                gt_files += [merge_files_into_one(all_times, gt[0], find_all_files(gt[0], gt[2]))]
+                gt_files += [merge_files_into_one(all_times, gt[0], find_all_files(gt[0], gt[2]),
+                                                  loading_threads)]
 
         if many_files_algo:
-            algo_files = [merge_files_into_one(all_times, algo[0], find_all_files(algo[0], algo[1]))]
+            algo_files = [merge_files_into_one(all_times, algo[0], find_all_files(algo[0], algo[1]),
+                                               loading_threads)]
             if len(algo) > 2:
-                algo_files += [merge_files_into_one(all_times, algo[0], find_all_files(algo[0], algo[2]))]
+                algo_files += [merge_files_into_one(all_times, algo[0], find_all_files(algo[0], algo[2]),
+                                                    loading_threads)]
         debug_center.show_in_console(None, "Tech", "...done merging files")
 
     if many_files_gt == 0:
@@ -253,12 +396,18 @@ if __name__ == '__main__':
     gt_path = os.path.join(gt[0], gt_input)
     algo_path = os.path.join(algo[0], algo_input)
 
-    evaluate.run(gt_path, algo_path, algo_parser, algo_name,
-                 ground_truth_special_parser=gt_parser,
-                 output_summary_stdout=output_to_stdout != [],
-                 evaluate_tracking=evaluate_tracking,
-                 input_directory=automatic_details_drawing_params[1] if automatic_details_drawing_params else None,
-                 input_file_part=automatic_details_drawing_params[2] if automatic_details_drawing_params else None)
+    try:
+        evaluate.run(gt_path, algo_path, algo_parser, algo_name,
+                     ground_truth_special_parser=gt_parser,
+                     output_summary_stdout=output_to_stdout != [],
+                     evaluate_tracking=evaluate_tracking,
+                     input_directory=automatic_details_drawing_params[1] if automatic_details_drawing_params else None,
+                     input_file_part=automatic_details_drawing_params[2] if automatic_details_drawing_params else None,
+                     workers=workers, streaming=streaming)
+    finally:
+        # inputs merged in memory are freed before the outputs are moved
+        discard_memory_input(gt_path)
+        discard_memory_input(algo_path)
 
     debug_center.show_in_console(None, "Progress", "Moving files to output...")
 
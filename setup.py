@@ -41,7 +41,7 @@ setuptools.setup(
         name="evalplatform",
         description="Evaluation Platform",
         packages=setuptools.find_packages(exclude=[
-            "tests", "examples"
+            "tests", "examples", "benchmarks"
         ]),
         setup_requires=[
             "pytest"
@@ -1,6 +1,11 @@
+import gzip
+import os
+import zipfile
+
 import numpy as np
 
 from ep import evaluate
+from ep.evalplatform.utils import get_memory_input, open_input
 from tests.testbase import TestBase
 
 
@@ -21,8 +26,8 @@ class TestEvalute(TestBase):
         self.save_temp(image3_path, self.image_1)
 
         output_file = evaluate.merge_files_into_one([1, 3, 12], "", files)
-        self.to_clear.append(output_file)
-        with open(output_file, "r") as f:
+        self.assertFalse(os.path.exists(output_file))
+        with open_input(output_file) as f:
             lines = f.readlines()
             self.assertEqual(4, len(lines))
             self.assertEqual("Frame_number, Filepath\n", lines[0])
@@ -40,8 +45,8 @@ class TestEvalute(TestBase):
         self.save_temp(image3_path, self.image_1)
 
         output_file = evaluate.merge_files_into_one([1, 12], "", files)
-        self.to_clear.append(output_file)
-        with open(output_file, "r") as f:
+        self.assertFalse(os.path.exists(output_file))
+        with open_input(output_file) as f:
             lines = f.readlines()
             self.assertEqual(3, len(lines))
             self.assertEqual("Frame_number, Filepath\n", lines[0])
@@ -61,10 +66,90 @@ class TestEvalute(TestBase):
         files = ["f1", "f2"]
 
         output_file = evaluate.merge_files_into_one([1, 2], "", files)
-        self.to_clear.append(output_file)
-        with open(output_file, "r") as f:
+        self.assertFalse(os.path.exists(output_file))
+        with open_input(output_file) as f:
             lines = f.readlines()
             self.assertEqual(3, len(lines))
             self.assertEqual("Frame_number, headers\n", lines[0])
             self.assertEqual("1,plik1_data\n", lines[1])
             self.assertEqual("2,plik2_data\n", lines[2])
+
+    def test_merge_files_into_one_archive(self):
+        archive_path = "frames.zip"
+        self.to_clear.append(archive_path)
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("frames/data2.csv", "headers\nplik2_data\n")
+            archive.writestr("frames/data1.csv", "headers\r\nplik1_data\r\n")
+            archive.writestr("frames/readme.txt", "not a frame")
+        with gzip.open("data3.csv.gz", "wb") as f:
+            f.write(b"headers\nplik3_data\n")
+        self.to_clear.append("data3.csv.gz")
+
+        files = sorted([f for f in evaluate.find_all_files(".", "data") if ".csv" in f])
+        self.assertEqual(["data3.csv.gz", "frames.zip/frames/data1.csv", "frames.zip/frames/data2.csv"], files)
+        self.assertEqual([3, 1, 2], evaluate.determine_all_snaptimes(files))
+
+        output_file = evaluate.merge_files_into_one([1, 2, 3], "", files, threads=3)
+        self.assertEqual("data3.csv.gz.merged.tmp", output_file)
+        self.assertEqual("frames.zip.frames.data1.csv.merged.tmp",
+                         evaluate.merged_file_name("", "frames.zip/frames/data1.csv", ".merged"))
+        with open_input(output_file) as f:
+            self.assertEqual(["Frame_number, headers\n", "1,plik1_data\n", "2,plik2_data\n", "3,plik3_data\n"],
+                             f.readlines())
+
+    def test_find_all_files_archive_name(self):
+        archive_path = "seg_and_track.zip"
+        self.to_clear.append(archive_path)
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("seg001.csv", "headers\n")
+            archive.writestr("track001.csv", "headers\n")
+        self.assertEqual(["seg_and_track.zip/seg001.csv"], evaluate.find_all_files(".", "seg"))
+        self.assertEqual(["seg_and_track.zip/track001.csv"], evaluate.find_all_files(".", "track"))
+
+    def test_merge_seg_track_files(self):
+        seg = self.create_temp("seg1.csv")
+        seg.write("Cell_number,Position_X,Position_Y\n")
+        seg.write("1,10,20\n")
+        seg.close()
+        track = self.create_temp("track1.csv")
+        track.write("Cell_number,Unique_cell_number\n")
+        track.write("1,5\n")
+        track.close()
+
+        merged_seg = evaluate.merge_files_into_one([1], "", ["seg1.csv"])
+        merged_track = evaluate.merge_files_into_one([1], "", ["track1.csv"])
+        output_file = evaluate.merge_seg_track_files("", [merged_seg, merged_track])
+        self.assertEqual("seg1.csv.merged.tmp.merged2", output_file)
+        self.assertIsNone(get_memory_input(merged_seg))
+        self.assertIsNone(get_memory_input(merged_track))
+        self.to_clear.append(output_file)
+        self.assertTrue(os.path.isfile(output_file))
+        with open_input(output_file) as f:
+            self.assertEqual(["Frame_number, Cell_number,Position_X,Position_Y,Unique_cell_number\n",
+                              "1,1,10,20,5\n"], f.readlines())
+
+    def test_merge_seg_track_files_unsorted(self):
+        seg = self.create_temp("seg.csv.merged")
+        seg.write("Frame_number, Cell_number,Position_X,Position_Y\n")
+        seg.write("2,1,11,21\n1,2,15,25\n1,1,10,20\n1,2,16,26\n10,1,12,22\n")
+        seg.close()
+        track = self.create_temp("track.csv.merged")
+        track.write("Frame_number, Cell_number,Unique_cell_number\n")
+        track.write("1,1,5\n2,1,7\n3,1,8\n1,1,6\n")
+        track.close()
+
+        expected = ["Frame_number, Cell_number,Position_X,Position_Y,Unique_cell_number\n",
+                    "1,1,10,20,6\n", "1,2,16,26,-1\n", "2,1,11,21,7\n", "10,1,12,22,-1\n"]
+        for chunk_rows in [None, 1, 2]:
+            output_file = evaluate.merge_seg_track_files("", ["seg.csv.merged", "track.csv.merged"], chunk_rows)
+            if output_file not in self.to_clear:
+                self.to_clear.append(output_file)
+            with open_input(output_file) as f:
+                self.assertEqual(expected, f.readlines())
+
+    def test_externally_sorted_rows(self):
+        rows = [((2, 1), ["a"]), ((1, 1), []), ((2, 1), ["b,c"]), ((1, 3), ["d"]), ((1, 2), ["e"])]
+        self.assertEqual(sorted(rows, key=lambda row: row[0]), list(evaluate.externally_sorted_rows(iter(rows), 2)))
+        self.assertEqual(rows[3:4], list(evaluate.externally_sorted_rows(iter(rows[3:4]), 1)))
+        self.assertEqual([], list(evaluate.externally_sorted_rows(iter([]), 2)))
+        self.assertRaises(evaluate.UnsortedRowsError, list, evaluate.checked_sorted_rows(rows))
@@ -0,0 +1,117 @@
+import os
+import shutil
+import tempfile
+import zipfile
+
+import numpy as np
+
+from ep.evalplatform.input_cache import *
+from ep.evalplatform.parsers import DefaultPlatformParser
+from ep.evalplatform.parsers_image import LabelImageParser
+from ep.evalplatform.yeast_datatypes import CellOccurence, PackedMask
+from tests.testbase import TestBase
+
+
+class CountingParser(DefaultPlatformParser):
+    def __init__(self):
+        DefaultPlatformParser.__init__(self)
+        self.loaded = 0
+
+    def load_from_file(self, path):
+        self.loaded += 1
+        return DefaultPlatformParser.load_from_file(self, path)
+
+
+class TestInputCache(TestBase):
+    def setUp(self):
+        super(TestInputCache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.cache = InputCache(os.path.join(self.directory, "cache"), 1024 * 1024)
+
+    def tearDown(self):
+        super(TestInputCache, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def write_csv(self, path, lines):
+        if path not in self.to_clear:
+            self.to_clear.append(path)
+        with open(path, "w") as f:
+            f.write("\n".join(["Frame_number,Cell_number,Position_X,Position_Y,Unique_cell_number"] + lines) + "\n")
+
+    def test_save_and_load_table(self):
+        cells = [CellOccurence("a", 1, -1, (1.0, 2.0)), CellOccurence(2, 2, 5, (3.5, 4.0), 1),
+                 CellOccurence(2, 3, 6, (5.0, 6.0))]
+        cells[0].mask = np.array([[True, False, True]])
+        cells[0].mask_slice = (slice(1, 2), slice(3, 6))
+        cells[2].mask = np.ones((2, 1), dtype=bool)
+        cells[2].mask_slice = (slice(0, 2), slice(7, 8))
+        path = os.path.join(self.directory, "table.npz")
+        save_table(path, CellTable.from_cells(cells).select([0, 1, 2]))
+
+        loaded = load_table(path).cells()
+        self.assertEqual(cells, loaded)
+        self.assertEqual(["a", 2, 2], [c.frame_number for c in loaded])
+        self.assertEqual([[True, False, True]], loaded[0].mask.tolist())
+        self.assertEqual(cells[2].mask_slice, loaded[2].mask_slice)
+        self.assertIsNone(loaded[1].mask)
+        self.assertIsNone(load_table(path).select([1]).cells()[0].mask_slice)
+        self.assertIsInstance(load_table(path).mask[0], PackedMask)
+
+    def test_load(self):
+        self.write_csv("cache_test.csv", ["1,1,10.5,20,3", "2,1,11,21,3"])
+        parser = CountingParser()
+        expected = list(parser.load_from_file("cache_test.csv"))
+        self.assertEqual(expected, list(self.cache.load("cache_test.csv", parser)))
+        self.assertEqual(expected, list(self.cache.load("cache_test.csv", parser)))
+        self.assertEqual(2, parser.loaded)
+        self.assertEqual(1, len(self.cache.entries()))
+
+        # file changed
+        self.write_csv("cache_test.csv", ["1,1,10.5,20,3"])
+        self.assertEqual(1, len(self.cache.load("cache_test.csv", parser)))
+        self.assertEqual(3, parser.loaded)
+        self.assertEqual(2, len(self.cache.entries()))
+
+        # only modification time changed
+        os.utime("cache_test.csv", (0, 0))
+        self.assertEqual(1, len(self.cache.load("cache_test.csv", parser)))
+        self.assertEqual(3, parser.loaded)
+
+    def test_load_images(self):
+        image = np.zeros((10, 10), dtype=np.uint8)
+        image[2:4, 3:6] = 7
+        image[6, 6] = 9
+        self.save_temp("cache_test.png", image)
+        expected = LabelImageParser().load_from_file("cache_test.png")
+        self.cache.load("cache_test.png", LabelImageParser())
+        loaded = self.cache.load("cache_test.png", LabelImageParser())
+        self.assertEqual([c for (_, c) in expected], [c for (_, c) in loaded])
+        self.assertEqual([c.area for (_, c) in expected], [c.area for (_, c) in loaded])
+
+    def test_evict(self):
+        for i in range(3):
+            self.write_csv("cache_test{0}.csv".format(i), ["1,{0},10.5,20,3".format(c) for c in range(10 * i + 1)])
+            self.cache.load("cache_test{0}.csv".format(i), DefaultPlatformParser())
+        entries = self.cache.entries()
+        self.assertEqual(3, len(entries))
+
+        # the least recently used are removed
+        os.utime(entries[0][2], (0, 0))
+        self.cache.max_size = entries[1][1] + entries[2][1]
+        self.cache.evict()
+        self.assertEqual([e[2] for e in entries[1:]], [e[2] for e in self.cache.entries()])
+
+    def test_store_failed(self):
+        entry_path = self.cache.entry_path("failed")
+        self.assertRaises(AttributeError, self.cache.store, entry_path, None)
+        self.assertEqual([], os.listdir(self.cache.directory))
+
+    def test_load_archived(self):
+        archive_path = os.path.join(self.directory, "cells.zip")
+        with zipfile.ZipFile(archive_path, "w") as archive:
+            archive.writestr("cells.csv", "Frame_number,Cell_number,Position_X,Position_Y\n1,1,10.5,20\n")
+        parser = CountingParser()
+        path = archive_path + "/cells.csv"
+        self.assertEqual(list(parser.load_from_file(path)), list(self.cache.load(path, parser)))
+        self.assertEqual(1, len(self.cache.load(path, parser)))
+        self.assertEqual(2, parser.loaded)
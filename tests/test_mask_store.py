@@ -0,0 +1,97 @@
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from ep.evalplatform.mask_store import *
+from ep.evalplatform.matching import OverlapTable
+from ep.evalplatform.parsers_image import LabelImageParser
+from ep.evalplatform.yeast_datatypes import CellTable
+
+
+class TestMaskStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = MaskStore(os.path.join(self.directory, "masks"))
+        self.image = np.zeros((20, 20), dtype=np.uint8)
+        self.image[2:5, 3:7] = 4
+        self.image[10, 10:12] = 9
+        self.image[11, 11] = 9
+
+    def tearDown(self):
+        self.store.clear()
+        shutil.rmtree(self.directory)
+
+    def parse(self, mask_store):
+        parser = LabelImageParser()
+        parser.mask_store = mask_store
+        (labels, colours) = parser.image_to_labels(self.image)
+        return parser.parse_labels(1, labels, colours)
+
+    def test_parse_labels(self):
+        expected = self.parse(None)
+        cells = self.parse(self.store)
+        self.assertEqual(1, len(os.listdir(self.store.directory)))
+        self.assertEqual(expected, cells)
+        for (expected_cell, cell) in zip(expected, cells):
+            self.assertIsNone(cell._mask)
+            self.assertTrue(cell.has_contour_data())
+            assert_array_equal(expected_cell.mask, cell.mask)
+            self.assertEqual(expected_cell.area, cell.area)
+        self.assertAlmostEqual(expected[0].overlap(expected[1]), cells[0].overlap(cells[1]))
+        self.assertEqual([[True, True], [False, True]], cells[1].mask.tolist())
+
+    def test_release(self):
+        cells = self.parse(self.store)
+        masks = [c.mask for c in cells]
+        self.assertIsNotNone(cells[0].mask_source.labels)
+
+        release_masks(cells)
+        self.assertEqual([None, None], [c._mask for c in cells])
+        self.assertIsNone(cells[0].mask_source.labels)
+        for (mask, cell) in zip(masks, cells):
+            assert_array_equal(mask, cell.mask)
+
+        # cells with masks in memory keep them
+        cells = self.parse(None)
+        release_masks(cells)
+        self.assertIsNotNone(cells[0]._mask)
+        table = CellTable.from_cells(cells)
+        release_masks(table.cells())
+        self.assertTrue(table.cells()[0].has_contour_data())
+
+    def test_overlap_table(self):
+        expected = OverlapTable.from_cells(self.parse(None)[::-1], self.parse(None))
+        cells = self.parse(self.store)
+        table = OverlapTable.from_cells(cells[::-1], cells)
+        self.assertEqual(expected.overlaps, table.overlaps)
+        assert_array_equal(expected.ground_truth_areas, table.ground_truth_areas)
+        self.assertEqual(1.0, table.index_iou(1, 0))
+
+        # only some of the cells from the label image
+        table = OverlapTable.from_cells(cells[1:], cells)
+        self.assertEqual([(1, 2)], table.pairs())
+        assert_array_equal([12, 3], table.ground_truth_areas)
+
+    def test_copy(self):
+        cells = self.parse(self.store)
+        cells[0].mask
+        copied = pickle.loads(pickle.dumps(cells))
+        self.assertIsNone(copied[0].mask_source.labels)
+        assert_array_equal(cells[0].mask, copied[0].mask)
+        assert_array_equal(cells[1].mask, copied[1].mask)
+
+    def test_clear(self):
+        self.assertIsNone(self.store.directory)
+        self.parse(self.store)
+        self.parse(self.store)
+        directory = self.store.directory
+        self.assertEqual(["0.npy", "1.npy"], sorted(os.listdir(directory)))
+        self.store.clear()
+        self.assertFalse(os.path.exists(directory))
+        self.assertTrue(os.path.isdir(os.path.join(self.directory, "masks")))
+
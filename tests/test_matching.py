@@ -0,0 +1,111 @@
+import unittest
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from ep.evalplatform.matching import *
+from ep.evalplatform.parsers_image import MaskImageParser
+from ep.evalplatform.utils import slices_intersection
+from ep.evalplatform.yeast_datatypes import CellOccurence
+
+
+class TestCandidatePairs(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.RandomState(7)
+
+    def random_cells(self, count, with_masks=False):
+        cells = []
+        for i in range(count):
+            position = tuple(self.random.uniform(0, 300, 2))
+            cell = CellOccurence(1, i + 1, -1, position)
+            if with_masks:
+                y, x = int(position[1]), int(position[0])
+                height, width = self.random.randint(1, 15, 2)
+                cell.mask_slice = (slice(y, y + height), slice(x, x + width))
+                cell.mask = np.ones((height, width), dtype=bool)
+            cells.append(cell)
+        return cells
+
+    def test_close_positions(self):
+        points_a = self.random.uniform(0, 100, (50, 2))
+        points_b = self.random.uniform(0, 100, (60, 2))
+        pairs = close_positions(points_a, points_b, 10)
+        expected = [(a, b) for a in range(50) for b in range(60) if
+                    np.linalg.norm(points_a[a] - points_b[b]) <= 10]
+        self.assertEqual(expected, sorted(pairs))
+        self.assertEqual([], close_positions(points_a, points_b[:0], 10))
+
+    def test_overlapping_bounds(self):
+        gt = self.random_cells(80, with_masks=True)
+        res = self.random_cells(70, with_masks=True)
+        pairs = overlapping_bounds(slice_bounds(gt), slice_bounds(res))
+        expected = [(a, b) for a in range(80) for b in range(70) if
+                    slices_intersection(gt[a].mask_slice, res[b].mask_slice) is not None]
+        self.assertEqual(expected, sorted(pairs))
+
+    def test_candidate_pairs_mixed(self):
+        gt = self.random_cells(40, with_masks=True) + self.random_cells(40)
+        res = self.random_cells(30) + self.random_cells(30, with_masks=True)
+        pairs = candidate_pairs(gt, res, 20)
+
+        def expected_candidate(g, r):
+            if g.has_contour_data() and r.has_contour_data():
+                return slices_intersection(g.mask_slice, r.mask_slice) is not None
+            return g.distance(r) <= 20
+
+        expected = [(a, b) for a in range(80) for b in range(60) if expected_candidate(gt[a], res[b])]
+        self.assertEqual(expected, pairs)
+
+
+class TestOverlapTable(unittest.TestCase):
+    def setUp(self):
+        self.parser = MaskImageParser()
+        self.ground_truth = np.zeros((40, 40), dtype=np.uint8)
+        self.ground_truth[8:15, 3:10] = 1
+        self.ground_truth[20:30, 20:30] = 2
+        self.results = np.zeros((40, 40), dtype=np.uint8)
+        self.results[10:18, 7:13] = 1
+        self.results[22:30, 18:28] = 2
+        self.results[1:3, 30:35] = 3
+
+    def test_overlaps_and_areas(self):
+        table = OverlapTable(self.ground_truth, self.results)
+        self.assertEqual([(1, 1), (2, 2)], table.pairs())
+        self.assertEqual(15, table.overlap(1, 1))
+        self.assertEqual(0, table.overlap(1, 3))
+        assert_array_equal([49, 100], table.ground_truth_areas[1:])
+        assert_array_equal([48, 80, 10], table.results_areas[1:])
+        self.assertAlmostEqual(15.0 / (49 + 48 - 15), table.iou(1, 1))
+        self.assertAlmostEqual(0, table.iou(2, 3))
+
+    def test_from_cells(self):
+        gt = self.parser.parse_labels(1, self.ground_truth, {})
+        res = self.parser.parse_labels(1, self.results, {})
+        table = OverlapTable.from_cells(gt, res)
+        for (i, g) in enumerate(gt):
+            for (j, r) in enumerate(res):
+                self.assertEqual(g.iou(r), table.index_iou(i, j))
+
+        res_overlapping = res + self.parser.parse_labels(1, self.results, {})
+        self.assertIsNone(OverlapTable.from_cells(gt, res_overlapping))
+        self.assertIsNone(OverlapTable.from_cells(gt, res + [CellOccurence(1, 4, -1, (3, 3))]))
+
+
+class TestOptimalMatching(unittest.TestCase):
+    def test_single_component(self):
+        # greedy would take (b, x) and leave a and y unmatched
+        edges = [(5, ("a", "x")), (6, ("b", "x")), (4, ("b", "y"))]
+        self.assertEqual([("a", "x"), ("b", "y")], optimal_matching(edges))
+
+    def test_many_components(self):
+        edges = [(1, ("a", "x")), (2, ("b", "y")), (3, ("c", "y")), (1.5, ("c", "z")), (1, ("d", "w"))]
+        self.assertEqual([("b", "y"), ("c", "z"), ("a", "x"), ("d", "w")], optimal_matching(edges))
+        self.assertEqual([], optimal_matching([]))
+
+    def test_assign_component(self):
+        # rows 0 and 1 compete for column 0, row 2 has only weak edge
+        (edge_a, edge_b) = (np.array([0, 1, 1, 2, 0]), np.array([0, 0, 1, 1, 2]))
+        weights = np.array([5.0, 6.0, 4.0, 0.5, 1.0])
+        self.assertEqual([0, 2], sorted(assign_component(edge_a, edge_b, weights).tolist()))
+        self.assertEqual([0, 0, 0, 0, 0], edge_components(edge_a, edge_b).tolist())
+        self.assertEqual([0, 1], edge_components(np.array([0, 1]), np.array([1, 0])).tolist())
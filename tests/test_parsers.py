@@ -26,6 +26,18 @@ class TestCellTracerParser(unittest.TestCase):
                        CellOccurence(2, 5, 5, (288.3, 261.77), 0)]
         self.assertSequenceEqual(output, correct_out)
 
+    def test_parse_links(self):
+        lines = self.input + ["2,3,300,200,3",
+                              "2,4,310,210,3",  # split
+                              "2,5,320,220,7",  # not in the previous frame
+                              "3,1,321,221,4"]
+        ct_parser = CellTracerParser()
+        output = list(list(zip(*ct_parser.parse(lines)))[1])
+        self.assertEqual([1, 2, 3, 4, 1, 5, 3, 6, 6], [c.unique_id for c in output])
+        self.assertEqual([c.unique_id for c in output], [c.cell_id for c in output])
+        self.assertEqual([1, 1, 1, 1, 2, 2, 2, 2, 3], [c.frame_number for c in output])
+        self.assertSequenceEqual(ct_parser.parse(lines), list(ct_parser.iterate(iter(lines))))
+
 
 class TestCellStarParser(unittest.TestCase):
     def setUp(self):
@@ -44,3 +56,110 @@ class TestCellStarParser(unittest.TestCase):
                         CellOccurence(2, 1, 3, (256.0, 122.1))]
         self.assertSequenceEqual(correct2_out, output)
 
+
+    def test_iterate(self):
+        cstar_parser = CellStarParser()
+        self.assertSequenceEqual(cstar_parser.parse(self.input), list(cstar_parser.iterate(iter(self.input))))
+        self.assertSequenceEqual([], list(cstar_parser.iterate([])))
+
+
+class TestCellProfilerParserTracking(unittest.TestCase):
+    def setUp(self):
+        measurements = ",".join(["0.5"] * 50)
+        self.input = ["ImageNumber,ObjectNumber,Location_X,Location_Y",
+                      "1,1,10.5,20,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0," + measurements,
+                      "1,2,15,25,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,0," + measurements,
+                      "2,1,11,21,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,2," + measurements]
+
+    def test_parse(self):
+        parser = CellProfilerParserTracking()
+        self.assertEqual([0, 1, 2, 3, 12], parser.used_columns())
+        parsed = parser.parse(self.input)
+        self.assertSequenceEqual([CellOccurence(1, 1, 1, (10.5, 20.0)), CellOccurence(1, 2, 2, (15.0, 25.0)),
+                                  CellOccurence(2, 2, 2, (11.0, 21.0))], [c for (_, c) in parsed])
+        self.assertSequenceEqual(parsed, list(parser.iterate(iter(self.input))))
+
+    def test_split_columns(self):
+        parser = CellProfilerParserTracking()
+        lines = self.input[1:]
+        split = parser.split_columns(lines, [1, 12])
+        self.assertEqual({1: ["1", "2", "1"], 12: ["0", "0", "2"]}, split)
+        quoted = ['"' + lines[0].replace(",", '","') + '"'] + lines[1:]
+        self.assertEqual(split, parser.split_columns(quoted, [1, 12]))
+        parser.configure(self.input[0].replace(",", ";"))
+        semicolons = [line.replace(",", ";").replace(".", ",") for line in lines]
+        self.assertEqual({2: ["10.5", "15", "11"], 4: ["0.1"] * 3}, parser.split_columns(semicolons, [2, 4]))
+
+    def test_split_used_line(self):
+        parser = CellProfilerParserTracking()
+        parser.set_original_line('1,2,"10,5", 20 ,0.1,0.2,0.3,0.4,0.5,0.6,0.7,0.8,3,0.5,0.5')
+        self.assertEqual(13, len(parser.original_columns))
+        self.assertEqual(["10.5", "20", "3"], [parser.get_original_column(name) for name in
+                                               ["position_x", "position_y", "last_frame_nr"]])
+
+
+class TestCellProfilerParser(unittest.TestCase):
+    def test_parse(self):
+        lines = ["ImageNumber,ObjectNumber,Cell_colour,Location_X,Location_Y",
+                 "1,1,0,10.5,20", "1,2,2,15,25", "2,1,0,11,21"]
+        parser = CellProfilerParser()
+        parsed = parser.parse(lines)
+        self.assertEqual([1, 1, 2], list(parsed.frame_number))
+        self.assertEqual([0, 2, 0], list(parsed.colour))
+        self.assertSequenceEqual(list(parser.iterate(iter(lines))), list(parsed))
+
+        # frames named with strings
+        named = CellProfilerParser().parse(["a,1,10.5,20", "b,1,11,21"])
+        self.assertEqual(object, named.frame_number.dtype)
+        self.assertEqual([("a", CellOccurence("a", 1, -1, (10.5, 20.0))),
+                          ("b", CellOccurence("b", 1, -1, (11.0, 21.0)))], list(named))
+
+
+class TestCellIDParser(unittest.TestCase):
+    def test_get_column(self):
+        # columns of the overridden set_line are not normalized
+        parser = CellIDParser()
+        parser.set_line("3\t0\t5\t 10.5\t20,5\n")
+        self.assertEqual(["3", "1", " 10.5", "20,5"], [parser.get_column(name) for name in
+                                                       ["cell_nr", "frame_nr", "position_x", "position_y"]])
+
+
+class TestDefaultPlatformParser(unittest.TestCase):
+    def setUp(self):
+        self.input = ["Frame_number,Cell_number,Cell_colour,Position_X,Position_Y,Unique_cell_number",
+                      "1,1,0,10.5,20,3",
+                      "1,2,1,15,25,4",
+                      "2,1,0,11,21,3"]
+
+    def test_iterate(self):
+        parser = DefaultPlatformParser()
+        parsed = parser.parse(self.input)
+        self.assertEqual(CellOccurence(1, 2, 4, (15.0, 25.0), 1), parsed[1][1])
+        self.assertSequenceEqual(parsed, list(parser.iterate(iter(self.input))))
+        self.assertSequenceEqual(parsed[1:], list(parser.iterate(self.input[2:])))
+
+    def parse_lines(self, lines):
+        parser = DefaultPlatformParser()
+        data_lines = parser.data_lines(lines)
+        return [parser.parse_line(line) for line in data_lines]
+
+    def test_parse_columns(self):
+        parser = DefaultPlatformParser()
+        parsed = parser.parse_columns(self.input)
+        self.assertEqual(3, len(parsed))
+        self.assertEqual([1, 1, 2], list(parsed.frame_number))
+        self.assertEqual([3, 4, 3], list(parsed.unique_id))
+        self.assertEqual([0, 1, 0], list(parsed.colour))
+        self.assertEqual((1, CellOccurence(1, 2, 4, (15.0, 25.0), 1)), parsed[1])
+        self.assertSequenceEqual(self.parse_lines(self.input), list(parsed))
+        parsed[1][1].colour = 0
+        self.assertEqual([0, 0, 0], list(parsed.colour))
+
+    def test_parse_columns_formats(self):
+        inputs = [["Cell_number,Frame_number,Position_Y,Position_X", "1,1,20,10.5\n", "2,3,25,15\n"],
+                  ["Frame_number;Cell_number;Position_X;Position_Y", "1;1;10,5;20", "1;2; 15,25 ;25"],
+                  ["Frame_number,Cell_number,Position_X,Position_Y", '1,1,"10,5",20', "1,2,15,25"],
+                  ["1,1,10.5,20", "2,1,11,21"],
+                  ["Frame_number,Cell_number,Position_X,Position_Y"]]
+        for lines in inputs:
+            self.assertSequenceEqual(self.parse_lines(lines), list(DefaultPlatformParser().parse(lines)))
@@ -7,6 +7,11 @@ from numpy.testing import *
 from ep.evalplatform.parsers_image import *
 
 
+class FakeCell(CellOccurence):
+    """Cell which can be marked with any additional attributes."""
+    pass
+
+
 class TestCellImageParser(unittest.TestCase):
     def setUp(self):
         self.parser = MaskImageParser()
@@ -105,10 +110,48 @@ class TestCellImageParser(unittest.TestCase):
         self.validate(cells[1], 2, 2, -1, (30, 10), 5)
         self.validate(cells[2], 2, 3, -1, (12, 10), 0)
 
+    def test_parse_labels_measures(self):
+        image = np.zeros((40, 40), dtype=np.uint8)
+        image[20:23, 1:4] = 5
+        image[21, 1] = 0
+        image[0, :] = np.arange(40) + 216  # up to 255 labels
+        cells = self.parser.parse_labels(1, image, {})
+        self.assertEqual(41, len(cells))
+        self.assertEqual([5] + list(range(216, 256)), [c.cell_id for c in cells])
+        self.assertEqual(8, cells[0].area)
+        self.assertEqual(np.count_nonzero(cells[0].mask), cells[0].area)
+        self.assertEqual((17 / 8.0, 21.0), cells[0].position)
+        self.assertEqual((39, 0), cells[-1].position)
+        self.assertSequenceEqual([], self.parser.parse_labels(1, np.zeros((5, 5), dtype=np.uint8), {}))
+
+    def test_label_frame(self):
+        image = np.zeros((40, 40), dtype=np.uint8)
+        image[8:15, 8:15] = 1
+        image[10, 30] = 4
+        image[20:23, 1:4] = 7
+        cells = self.parser.parse_labels(3, image, {4: 5})
+        frame = LabelFrame(3, image, {4: 5})
+        self.assertEqual(3, len(frame))
+        self.assertEqual([1, 4, 7], frame.labels.tolist())
+        self.assertEqual([c.colour for c in cells], frame.colour.tolist())
+        self.assertEqual(cells, [frame.cell(i) for i in range(len(frame))])
+        self.assertEqual([c.position for c in cells], [frame.cell(i).position for i in range(len(frame))])
+        self.assertEqual(0, len(LabelFrame(3, np.zeros((5, 5), dtype=np.uint8), {})))
+        self.assertEqual(0, len(self.parser.load_label_frame(3, None)))
+
+    def test_listed_images(self):
+        self.save_temp("image_1.png", self.image_1)
+        self.save_temp("image_2.png", self.image_2)
+        self.assertEqual([(1, "image_1.png")], self.parser.listed_images("image_1.png"))
+        self.prepare_merged("merged.png", ["image_1.png", "image_2.png"])
+        self.assertEqual([(1, "image_1.png"), (2, "image_2.png")], self.parser.listed_images("merged.png"))
+        frame = self.parser.load_label_frame(1, "image_2.png")
+        self.assertEqual([c for (_, c) in self.parser.load_from_file("image_2.png")], [frame.cell(0)])
+
     def fake_load_single_image(self, called):
         def load_single_image(f, p):
             imageio.imread(p)
-            fake = CellOccurence(f, 0, 0, None)
+            fake = FakeCell(f, 0, 0, None)
             fake.data = p
             called.append((fake.frame_number, p))
             return [fake]
@@ -176,6 +219,22 @@ class TestCellImageParser(unittest.TestCase):
         self.assertEqual(image2_path, res[1][1].data)
         self.assertEqual([(1, image1_path), (2, image2_path)], called)
 
+    def test_load_from_merged_file_threads(self):
+        paths = ["image_{0}.png".format(i) for i in range(1, 8)]
+        for (i, path) in enumerate(paths, 1):
+            image = np.zeros((10, 10), dtype=np.uint8)
+            image[:i, :i] = 1
+            self.save_temp(path, image)
+        merged_path = "merged.png"
+        self.prepare_merged(merged_path, paths)
+
+        expected = self.parser.load_from_file(merged_path)
+        self.parser.loading_threads = 3
+        res = self.parser.load_from_file(merged_path)
+        self.assertEqual([f for (f, _) in expected], [f for (f, _) in res])
+        self.assertEqual([c.area for (_, c) in expected], [c.area for (_, c) in res])
+        self.assertEqual(res, list(self.parser.iterate_from_file(merged_path)))
+
 
 class TestMaskImageParser(unittest.TestCase):
     RESULT_GT_PATH = os.path.join(os.path.dirname(__file__), "input", "result_gt.tif")
@@ -304,6 +363,28 @@ class TestLabelImageParser(unittest.TestCase):
         assert_array_equal(expected_labels, labels)
         self.assertEqual(expected_colours, colours)
 
+    def test_image_to_labels_many_values(self):
+        image = np.arange(256, dtype=np.uint8).reshape(16, 16)
+        labels, colours = self.parser.image_to_labels(image)
+        assert_array_equal(image, labels)
+        self.assertEqual(np.uint8, labels.dtype)
+        self.assertEqual(255, len(colours))
+
+        labels, colours = self.parser.image_to_labels(self.image_1.astype(np.int32) * 1000 - 1)
+        expected_labels, expected_colours = self.parser.image_to_labels(self.image_1)
+        expected_labels = expected_labels.astype(np.int32)
+        expected_labels[self.image_1 == 0] = -1  # the smallest value is not changed
+        assert_array_equal(expected_labels, labels)
+        self.assertEqual(expected_colours, colours)
+
+    def test_unique_inverse(self):
+        for image in [self.image_1, self.image_1.astype(np.int32) - 3, self.image_1 > 2, self.image_1[:0]]:
+            (values, indices) = unique_inverse(image)
+            (expected_values, expected_indices) = np.unique(image, return_inverse=True)
+            assert_array_equal(expected_values, values)
+            self.assertEqual(image.shape, indices.shape)
+            assert_array_equal(expected_indices.ravel(), indices.ravel())
+
     def test_load_from_file(self):
         image1_path = "image1.tiff"
         image2_path = "image2.png"
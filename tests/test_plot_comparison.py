@@ -1,9 +1,12 @@
 import os
 import sys
+import tempfile
 import unittest
 
+import numpy as np
+
 from ep.evalplatform import plot_comparison
-from ep.evalplatform.parsers_image import LabelImageParser, MaskImageParser
+from ep.evalplatform.parsers_image import LabelFrame, LabelImageParser, MaskImageParser
 from ep.evalplatform.yeast_datatypes import *
 from tests.test_parsers_image import TestMaskImageParser
 
@@ -59,6 +62,51 @@ class TestColours(unittest.TestCase):
         matching = plot_comparison.find_correspondence(gt, algo)
         self.assertEqual(0, len(matching))
 
+    def test_find_correspondence_optimal(self):
+        gt = [CellOccurence(1, 1, 1, (0, 0)), CellOccurence(1, 2, 2, (10, 0))]
+        algo = [CellOccurence(1, 1, 1, (6, 0)), CellOccurence(1, 2, 2, (16, 0))]
+        default_cutoff = plot_comparison.cutoff
+        plot_comparison.cutoff = 8
+        try:
+            matching = plot_comparison.find_correspondence(gt, algo)
+            self.assertEqual([(gt[1], algo[0])], matching)
+
+            plot_comparison.matching_method = "optimal"
+            matching = plot_comparison.find_correspondence(gt, algo)
+            self.assertEqual([(gt[0], algo[0]), (gt[1], algo[1])], matching)
+        finally:
+            plot_comparison.cutoff = default_cutoff
+            plot_comparison.matching_method = "greedy"
+
+    def test_load_general_ini_matching(self):
+        (handle, path) = tempfile.mkstemp(suffix=".ini")
+        try:
+            with os.fdopen(handle, "w") as ini_file:
+                ini_file.write("[evaluation]\nmatching = optimla\n")
+            self.assertRaises(Exception, plot_comparison.load_general_ini, path)
+            self.assertEqual("greedy", plot_comparison.matching_method)
+        finally:
+            os.remove(path)
+
+    def test_correspondence_cache(self):
+        cache = plot_comparison.CorrespondenceCache()
+        matching = cache.get(1, self.frame0GT, self.frame0Res)
+        self.assertEqual(4, len(matching[0]))
+        self.assertIsNone(matching[1])
+        self.assertIs(matching, cache.get(1, self.frame0GT, self.frame0Res))
+        self.assertIs(matching, cache.get(1, list(self.frame0GT), list(self.frame0Res)))
+
+        # different cells are matched again
+        other_matching = cache.get(1, self.frame0GT[:2], self.frame0Res)
+        self.assertEqual(2, len(other_matching[0]))
+        self.assertIsNot(matching, cache.get(1, self.frame0GT, self.frame0Res))
+
+        cache.get(2, self.frame1GT, self.frame1Res)
+        cache.retain([2])
+        self.assertEqual([2], list(cache.frames.keys()))
+        cache.evict(2)
+        self.assertEqual({}, cache.frames)
+
     def test_calculate_stats_tracking(self):
         # (last_gt,last_res),last_mapping,(new_gt,new_res),new_mapping
         # len(found_links), len(real_links), len(correct_links))
@@ -78,6 +126,99 @@ class TestColours(unittest.TestCase):
         self.assertEqual([3, 5, 3], list(map(len, wyniki[:3])))
         # precision = 100%
         # recall = 60%
+        self.assertEqual(0, len(wyniki[3]))
+        self.assertEqual([(1, 2, 4), (1, 2, 5)], sorted([(fn.prev_frame, fn.frame, fn.link_GT.cell_B.unique_id)
+                                                         for fn in wyniki[4]]))
+
+    def test_filter_border_table(self):
+        cells = [CellOccurence(1, 1, -1, (5, 50)), CellOccurence(1, 2, -1, (50, 50)),
+                 CellOccurence(1, 3, -1, (50, 50), 1), CellOccurence(1, 4, -1, (float("nan"), 50))]
+        default_ignored_frame_size = plot_comparison.ignored_frame_size
+        plot_comparison.ignored_frame_size = 10
+        try:
+            filtered = plot_comparison.filter_border(CellTable.from_cells(cells), (100, 100))
+            self.assertEqual([c.cell_id for c in plot_comparison.filter_border(cells, (100, 100))],
+                             [c.cell_id for c in filtered.cells()])
+            self.assertEqual([1, 3, 4], [c.cell_id for c in filtered.cells()])
+        finally:
+            plot_comparison.ignored_frame_size = default_ignored_frame_size
+
+    def test_group_by_frame(self):
+        frame_cells = [(1, self.frame0GT[0]), (2, self.frame1GT[0]), (1, self.frame0GT[1])]
+        self.assertEqual({1: self.frame0GT[:2], 2: self.frame1GT[:1]}, plot_comparison.group_by_frame(frame_cells))
+        self.assertEqual({}, plot_comparison.group_by_frame([]))
+
+    def test_iterate_by_frame(self):
+        frame_cells = [(1, self.frame0GT[0]), (1, self.frame0GT[1]), (2, self.frame1GT[0])]
+        self.assertEqual([(1, self.frame0GT[:2]), (2, self.frame1GT[:1])],
+                         list(plot_comparison.iterate_by_frame(iter(frame_cells))))
+        with self.assertRaises(Exception):
+            list(plot_comparison.iterate_by_frame(frame_cells + [(1, self.frame0GT[2])]))
+
+    def test_join_frames(self):
+        ground_truth = [(1, ["g1"]), (2, ["g2"]), (4, ["g4"])]
+        results = [(2, ["r2"]), (3, ["r3"]), (4, ["r4"]), (5, ["r5"])]
+        self.assertEqual([(2, (["g2"], ["r2"])), (4, (["g4"], ["r4"]))],
+                         list(plot_comparison.join_frames(ground_truth, results)))
+        self.assertEqual([(1, (["g1"], [])), (2, (["g2"], ["r2"])), (3, ([], ["r3"])), (4, (["g4"], ["r4"])),
+                          (5, ([], ["r5"]))],
+                         list(plot_comparison.join_frames(iter(ground_truth), iter(results), all_frames=True)))
+
+    def test_evaluate_segmentation_frames_in_workers(self):
+        frame_tasks = [(self.frame0GT, self.frame0Res, (100000, 100000)),
+                       (self.frame1GT, self.frame1Res, (100000, 100000))] * 3
+        serial = list(plot_comparison.evaluate_segmentation_frames(frame_tasks))
+        parallel = list(plot_comparison.evaluate_segmentation_frames(frame_tasks, workers=2))
+        batched = list(plot_comparison.evaluate_segmentation_frames(iter(frame_tasks), workers=2, batch_size=4))
+        self.assertEqual([evaluation[1] for evaluation in parallel], [evaluation[1] for evaluation in batched])
+        self.assertEqual(len(serial), len(parallel))
+        for ((stats, correspondence, border), (stats_p, correspondence_p, border_p)) in zip(serial, parallel):
+            self.assertEqual(stats[:2], stats_p[:2])
+            self.assertEqual([(r.cell_GT, r.cell_algo) for r in stats[2]],
+                             [(r.cell_GT, r.cell_algo) for r in stats_p[2]])
+            self.assertEqual(correspondence, correspondence_p)
+            self.assertEqual(border, border_p)
+
+    def test_evaluate_segmentation_labels(self):
+        ground_truth = np.zeros((30, 40), dtype=np.uint8)
+        ground_truth[2:10, 2:10] = 1
+        ground_truth[12:20, 12:20] = 2
+        ground_truth[12:20, 30:38] = 3
+        ground_truth[22:28, 2:8] = 4
+        results = np.zeros((30, 42), dtype=np.uint8)
+        results[3:10, 2:10] = 5
+        results[12:20, 13:21] = 2
+        results[12:20, 21:25] = 3
+        results[22:28, 30:40] = 9
+        results[0:2, 38:42] = 7
+        parser = LabelImageParser()
+        (ground_truth, ground_truth_colours) = parser.image_to_labels(ground_truth)
+        (results, results_colours) = parser.image_to_labels(results)
+        ground_truth_colours[4] = 3
+
+        defaults = (plot_comparison.ignored_frame_size, plot_comparison.output_evaluation_details)
+        try:
+            for (method, border, details) in [("greedy", 0, 0), ("greedy", 3, 1), ("optimal", 3, 1)]:
+                (plot_comparison.matching_method, plot_comparison.ignored_frame_size) = (method, border)
+                plot_comparison.output_evaluation_details = details
+                ground_truth_cells = parser.parse_labels(1, ground_truth, ground_truth_colours)
+                results_cells = parser.parse_labels(1, results, results_colours)
+                expected = plot_comparison.evaluate_segmentation_frame((ground_truth_cells, results_cells, (40, 30)))
+                evaluated = plot_comparison.evaluate_segmentation_labels(
+                    (LabelFrame(1, ground_truth, ground_truth_colours), LabelFrame(1, results, results_colours),
+                     (40, 30)))
+                self.assertEqual(expected[0][:2], evaluated[0][:2])
+                self.assertEqual(expected[1:], evaluated[1:])
+                if details:
+                    for (expected_results, evaluated_results) in zip(expected[0][2:], evaluated[0][2:]):
+                        self.assertEqual([r.csv_record() for r in expected_results],
+                                         [r.csv_record() for r in evaluated_results])
+                else:
+                    self.assertEqual([(0, 2), (1, 0)], evaluated[0][2])
+                    self.assertEqual([[1, 3, 4], [2]], list(evaluated[0][3:]))
+        finally:
+            (plot_comparison.ignored_frame_size, plot_comparison.output_evaluation_details) = defaults
+            plot_comparison.matching_method = "greedy"
 
     def test_calculate_stats_segmentation(self):
         """
@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from ep.evalplatform.plot_comparison import calculate_stats_tracking
+from ep.evalplatform.tracking import *
+from ep.evalplatform.yeast_datatypes import CellOccurence
+
+
+class TestConsecutiveLinkCounts(unittest.TestCase):
+    def test_counts(self):
+        keys = [1, 1, 1, 2, 2, 2, 3, 3]
+        frames = [0, 1, 1, 0, 2, 3, 1, 2]
+        # key 1: 0->1 twice, key 2: 2->3, key 3: 1->2
+        self.assertEqual([0, 2, 1, 1], list(consecutive_link_counts(keys, frames, 4)))
+        self.assertEqual([0, 0], list(consecutive_link_counts([], [], 2)))
+
+
+class TestTrackingTable(unittest.TestCase):
+    def setUp(self):
+        self.random = np.random.RandomState(3)
+
+    def random_frame(self, frame):
+        ground_truth = [CellOccurence(frame, i, self.random.randint(1, 8), (i, frame), self.random.randint(0, 2))
+                        for i in range(10)]
+        results = [CellOccurence(frame, i, self.random.randint(1, 8), (i, frame + 0.5)) for i in range(9)]
+        correspondence = [(gt, res) for (gt, res) in zip(ground_truth, results) if self.random.rand() < 0.8]
+        return (ground_truth, results), correspondence
+
+    def test_same_as_calculate_stats_tracking(self):
+        frames = [self.random_frame(f) for f in range(6)]
+        table = TrackingTable()
+        for (frame_data, correspondence) in frames:
+            table.add_frame(frame_data, correspondence)
+
+        expected = [(0, 0, 0)]
+        for (last, new) in zip(frames[:-1], frames[1:]):
+            links = calculate_stats_tracking(last[0], last[1], new[0], new[1])
+            expected.append(tuple(map(len, links[:3])))
+        self.assertEqual(expected, table.link_counts())
+
+        links = calculate_stats_tracking(frames[0][0], frames[0][1], frames[-1][0], frames[-1][1])
+        self.assertEqual(tuple(map(len, links[:3])), table.long_time_link_counts())
@@ -1,4 +1,10 @@
+import bz2
+import gzip
+import shutil
+import tempfile
+import time
 import unittest
+import zipfile
 
 from ep.evalplatform.utils import *
 
@@ -139,3 +145,89 @@ class TestReadWritePlot(unittest.TestCase):
         data = read_from_file(self.filename)
         self.assertEqual(data, self.data_read)
 
+
+
+class TestInputFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.text = "a,b\r\n1,2\n"
+        self.archive_path = os.path.join(self.directory, "data.zip")
+        with zipfile.ZipFile(self.archive_path, "w") as archive:
+            archive.writestr("frames/frame1.csv", self.text)
+            archive.writestr("frame2.csv.gz", gzip.compress(self.text.encode()))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_split_archive_path(self):
+        self.assertEqual((self.archive_path, "frames/frame1.csv"),
+                         split_archive_path(os.path.join(self.archive_path, "frames", "frame1.csv")))
+        self.assertEqual(("other.zip/frame1.csv", None), split_archive_path("other.zip/frame1.csv"))
+        self.assertEqual(["frames/frame1.csv", "frame2.csv.gz"], list_archive(self.archive_path))
+        self.assertEqual(os.path.join(self.directory, "data.zip.frames.frame1.csv"),
+                         flat_input_path(self.archive_path + "/frames/frame1.csv"))
+        self.assertEqual("res.csv", flat_input_path("res.csv"))
+        self.assertEqual("res.csv", strip_compression_suffix("res.csv.XZ"))
+        self.assertEqual("res.csv", strip_compression_suffix("res.csv"))
+
+    def test_open_input(self):
+        paths = [os.path.join(self.directory, name) for name in ["data.csv", "data.csv.gz", "data.csv.bz2"]]
+        for (path, opener) in zip(paths, [open, gzip.open, bz2.open]):
+            with opener(path, "wb") as f:
+                f.write(self.text.encode())
+        if lzma is not None:
+            paths.append(os.path.join(self.directory, "data.csv.xz"))
+            with lzma.open(paths[-1], "wb") as f:
+                f.write(self.text.encode())
+        paths += [self.archive_path + "/frames/frame1.csv", self.archive_path + "/frame2.csv.gz"]
+
+        for path in paths:
+            with open_input(path) as f:
+                self.assertEqual(["a,b\n", "1,2\n"], f.readlines())
+            with open_input(path, "rb") as f:
+                self.assertEqual(self.text.encode(), f.read())
+
+    def test_memory_input(self):
+        path = os.path.join(self.directory, "memory.csv")
+        store_memory_input(path, [b"a,b\n", b"1,2\n"])
+        with open_input(path) as f:
+            self.assertEqual(["a,b\n", "1,2\n"], f.readlines())
+        with open_input(path, "rb") as f:
+            self.assertEqual(b"a,b\n1,2\n", f.read())
+        discard_memory_input(path)
+        self.assertIsNone(get_memory_input(path))
+        discard_memory_input(path)
+
+
+class TestOrderedMap(unittest.TestCase):
+    def test_order(self):
+        def slow_square(x):
+            time.sleep(0.01 * (x % 3))
+            return x * x
+
+        for threads in [1, 4]:
+            self.assertEqual([x * x for x in range(20)], list(ordered_map(slow_square, range(20), threads)))
+        self.assertEqual([], list(ordered_map(slow_square, [], 4)))
+
+    def test_bounded(self):
+        started = []
+
+        def record(x):
+            started.append(x)
+            return x
+
+        results = ordered_map(record, range(100), 2, ahead=3)
+        self.assertEqual(0, next(results))
+        time.sleep(0.05)
+        self.assertTrue(len(started) <= 4)
+        self.assertEqual(list(range(1, 100)), list(results))
+
+    def test_error(self):
+        def fail_on_three(x):
+            if x == 3:
+                raise ValueError("three")
+            return x
+
+        results = ordered_map(fail_on_three, range(10), 3)
+        self.assertEqual([0, 1, 2], [next(results) for _ in range(3)])
+        self.assertRaises(ValueError, next, results)
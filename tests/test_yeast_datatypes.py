@@ -0,0 +1,149 @@
+import pickle
+import unittest
+
+import numpy as np
+
+from ep.evalplatform.yeast_datatypes import *
+
+
+class TestCellOccurence(unittest.TestCase):
+    def test_slots(self):
+        cell = CellOccurence(1, 2, 3, (4.0, 5.0))
+        with self.assertRaises(AttributeError):
+            cell.data = "not a cell attribute"
+        self.assertIsNone(cell.area)
+        cell.mask = np.ones((2, 2), dtype=bool)
+        self.assertEqual(4, cell.area)
+
+    def test_hash_follows_colour(self):
+        cell = CellOccurence(1, 2, 3, (4.0, 5.0))
+        self.assertIn(CellOccurence(1, 2, 3, (4.0, 5.0)), set([cell]))
+        cell.colour = 1
+        self.assertEqual(hash(CellOccurence(1, 2, 3, (4.0, 5.0), 1)), hash(cell))
+        self.assertNotIn(CellOccurence(1, 2, 3, (4.0, 5.0)), set([cell]))
+        self.assertIn(CellOccurence(1, 2, 3, (4.0, 5.0), 1), set([cell]))
+
+    def test_pickle_results(self):
+        cell_gt = CellOccurence(2, 1, 3, (4.0, 5.0))
+        cell_algo = CellOccurence(2, 4, 6, (4.5, 5.0), 1)
+        result = pickle.loads(pickle.dumps(SegmentationResult(cell_gt, cell_algo, 0.5)))
+        self.assertEqual([2, "CORRECT", 1, 4.0, 5.0, 4, 4.5, 5.0, 0.5], result.csv_record())
+        self.assertEqual(1, result.cell_algo.colour)
+
+        link = TrackingLink(CellOccurence(1, 1, 3, (4.0, 4.0)), cell_gt)
+        result = pickle.loads(pickle.dumps(TrackingResult(link, None)))
+        self.assertEqual(link, result.link_GT)
+        self.assertEqual((2, 1), (result.frame, result.prev_frame))
+
+
+class TestPackedMask(unittest.TestCase):
+    def setUp(self):
+        self.mask = np.array([[True, False, True, True, False, False, False, False, False, True],
+                              [False, True, True, True, True, True, True, True, True, True]])
+        self.mask_slice = (slice(3, 5), slice(5, 15))
+
+    def cell(self, mask, mask_slice):
+        cell = CellOccurence(1, 1, -1, (0.0, 0.0))
+        cell.mask_slice = mask_slice
+        cell.mask = mask
+        return cell
+
+    def test_pack(self):
+        packed = PackedMask.pack(self.mask, self.mask_slice)
+        # aligned to the image column 0 so the first 5 bits of every row are not set
+        self.assertEqual((2, 2), packed.bits.shape)
+        self.assertEqual([[0b00000101, 0b10000010], [0b00000011, 0b11111110]], packed.bits.tolist())
+        self.assertEqual(self.mask.shape, packed.shape)
+        self.assertEqual(self.mask.tolist(), packed.unpack().tolist())
+        self.assertEqual(13, packed.area())
+        self.assertEqual(self.mask.tolist(), PackedMask.pack(self.mask, (slice(0, 2), slice(8, 18))).unpack().tolist())
+
+    def test_overlap(self):
+        cell = self.cell(self.mask, self.mask_slice)
+        packed = self.cell(PackedMask.pack(self.mask, self.mask_slice), self.mask_slice)
+        self.assertEqual(13, packed.area)
+        self.assertEqual(self.mask.tolist(), packed.mask.tolist())
+        for (y, x) in [(3, 5), (4, 7), (2, 13), (4, 14), (5, 5), (3, 15)]:
+            other_slice = (slice(y, y + 2), slice(x, x + 10))
+            other = self.cell(~self.mask, other_slice)
+            packed_other = self.cell(PackedMask.pack(~self.mask, other_slice), other_slice)
+            self.assertEqual(cell.overlap(other), packed.overlap(packed_other))
+            self.assertEqual(cell.overlap(other), packed.overlap(other))
+            self.assertEqual(cell.iou(other), packed.iou(packed_other))
+        self.assertEqual(1.0, packed.iou(cell))
+
+    def test_table(self):
+        packed = self.cell(PackedMask.pack(self.mask, self.mask_slice), self.mask_slice)
+        view = CellTable.from_cells([packed]).cells()[0]
+        self.assertIs(packed.stored_mask(), view.stored_mask())
+        self.assertEqual(13, view.area)
+        self.assertEqual(self.mask.tolist(), view.mask.tolist())
+        self.assertIsInstance(pickle.loads(pickle.dumps(view)).stored_mask(), PackedMask)
+
+
+class TestCellTable(unittest.TestCase):
+    def setUp(self):
+        self.cells = [CellOccurence(2, 1, 5, (10.5, 20.0)),
+                      CellOccurence(1, 2, 6, (15.0, 25.0), 1),
+                      CellOccurence(2, 3, -1, (11.0, 21.0))]
+        self.table = CellTable.from_cells(self.cells)
+
+    def test_from_cells(self):
+        self.assertEqual(3, len(self.table))
+        self.assertEqual([(c.frame_number, c) for c in self.cells], list(self.table))
+        self.assertEqual((1, self.cells[1]), self.table[1])
+        self.assertEqual([(2, self.cells[2])], self.table[2:])
+        self.assertEqual([hash(c) for c in self.cells], [hash(c) for (_, c) in self.table])
+        self.assertEqual([True, True, False], [c.has_tracking_data() for (_, c) in self.table])
+
+    def test_string_frames(self):
+        table = CellTable.from_cells([CellOccurence("a", 1, -1, (1.0, 2.0)), CellOccurence(1, 2, -1, (3.0, 4.0))])
+        self.assertEqual(["a", 1], [frame for (frame, _) in table])
+        self.assertEqual(["a", 1], sorted(table.group_by_frame().keys(), key=str, reverse=True))
+
+    def test_masks(self):
+        mask = np.ones((2, 3), dtype=bool)
+        mask_slice = (slice(1, 3), slice(4, 7))
+        cell = CellOccurence(1, 1, -1, (5.0, 2.0))
+        cell.mask = mask
+        cell.mask_slice = mask_slice
+        view = CellTable.from_cells([cell, CellOccurence(1, 2, -1, (0.0, 0.0))]).cells()[0]
+        self.assertIs(mask, view.mask)
+        self.assertEqual(mask_slice, view.mask_slice)
+        self.assertEqual(6, view.area)
+        self.assertEqual(1.0, view.iou(cell))
+        self.assertIsNone(self.table.cells()[0].mask)
+
+        # attributes of CellOccurence which are not in the table
+        self.assertIsNone(view.mask_source)
+        self.assertFalse(view.release_mask())
+
+        view = self.table.cells()[2]
+        view.mask = mask
+        view.mask_slice = mask_slice
+        self.assertTrue(view.has_contour_data())
+        self.assertEqual(6, self.table.cells()[2].area)
+        self.assertEqual(mask_slice, self.table.cells()[2].mask_slice)
+        self.assertIsNone(self.table.cells()[0].mask)
+        self.assertEqual([False, False, True], [m is not None for m in self.table.mask])
+
+    def test_select_and_group_by_frame(self):
+        frames = self.table.group_by_frame()
+        self.assertEqual([1, 2], sorted(frames.keys()))
+        self.assertEqual([self.cells[0], self.cells[2]], frames[2].cells())
+        self.assertEqual([self.cells[1]], frames[1].cells())
+
+        # colour is changed in the original table
+        frames[2].set_colour(3)
+        frames[2].cells()[1].colour = 0
+        self.assertEqual([3, 1, 0], list(self.table.colour))
+        self.assertEqual([True, False], list(frames[2].select([1, 0]).obligatory()))
+        self.assertEqual([[10.5, 20.0], [11.0, 21.0]], frames[2].positions().tolist())
+        self.assertEqual([True, False], list(frames[2].has_tracking_data()))
+
+    def test_pickle(self):
+        cell = pickle.loads(pickle.dumps(self.table.cells()[1]))
+        self.assertIsInstance(cell, CellOccurence)
+        self.assertNotIsInstance(cell, CellView)
+        self.assertEqual(self.cells[1], cell)
+        self.assertIsNone(cell.mask)